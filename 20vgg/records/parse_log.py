@@ -50,10 +50,77 @@ class log_parser_base:
         pat_time = r"(?P<t>\d+): "
         self.patterns = {tok : re.compile(pat_time + pat) for tok, pat in tokens.items()}
         self.patterns["EOF"] = re.compile("^$")
+        # tokens that can only match when the line (after "NNN: ")
+        # begins with the given word ("" for "=== ...").  all other
+        # tokens (env and kernel_start/end) are tried on every line
+        keywords = {
+            "open"     : ["open_log"],
+            "close"    : ["close_log"],
+            "model"    : ["model_start", "model_end"],
+            "loading"  : ["load_start", "load_end"],
+            "warning"  : ["no_validation_warning"],
+            "train"    : ["train_data", "train_accuracy", "train_loss"],
+            "validate" : ["validation_data", "validate_accuracy", "validate_loss"],
+            "training" : ["training_start", "training_end"],
+            ""         : ["train_begin", "validate_begin"],
+            "sample"   : ["sample"],
+        }
+        self.keywords = {kw : set(toks) for kw, toks in keywords.items()}
+        # "NNN: " followed by the leading word; env tells whether
+        # the line may be a "var=val" or "var undefined" line
+        self.head_pattern = re.compile(pat_time + r"(?P<key>[A-Za-z0-9_]*)(?P<env>=| undefined)?")
+        self.body_patterns = [(tok, re.compile(pat)) for tok, pat in tokens.items()]
+        self.candidates = {}
         self.kpsr = kernel_parser()
         self.lines = []
         self.next_line()
 
+    def get_candidates(self, key, env):
+        """
+        token patterns that may match a line beginning with key,
+        in the same order as self.patterns
+        """
+        cands = self.candidates.get((key, env))
+        if cands is None:
+            toks = self.keywords.get(key, set())
+            cands = [(tok, regex) for tok, regex in self.body_patterns
+                     if tok in toks
+                     or (tok == "env" and env)
+                     or tok in ["kernel_start", "kernel_end"]]
+            self.candidates[key, env] = cands
+        return cands
+    def tokenize(self, line):
+        """
+        return (token kind, data) of line.
+        strip "NNN: " once and only try patterns that
+        may match the leading word of the rest
+        """
+        head = self.head_pattern.match(line)
+        if head is None:
+            if self.patterns["EOF"].match(line):
+                return "EOF", {}
+            return None, None
+        key = head.group("key")
+        env = key != "" and head.group("env") is not None
+        pos = head.start("key")
+        for tok, regex in self.get_candidates(key, env):
+            match = regex.match(line, pos)
+            if match:
+                data = {"t" : head.group("t")}
+                data.update(match.groupdict())
+                return tok, data
+        return None, None
+    def tokenize_linear(self, line):
+        """
+        return (token kind, data) of line, trying all
+        patterns in order.  slow; kept as the reference
+        tokenize must agree with
+        """
+        for tok, regex in self.patterns.items():
+            match = regex.match(line)
+            if match:
+                return tok, match.groupdict()
+        return None, None
     def next_line(self):
         """
         get next line, set token kind
@@ -61,14 +128,7 @@ class log_parser_base:
         self.line = self.fp.readline()
         if self.line != "":
             self.lines.append(self.line)
-        for tok, regex in self.patterns.items():
-            match = regex.match(self.line)
-            if match:
-                self.tok = tok
-                self.data = match.groupdict()
-                return
-        self.tok = None
-        self.data = None
+        self.tok, self.data = self.tokenize(self.line)
     def call_action(self, tok):
         """
         call callback defined in subclasses
@@ -397,10 +457,13 @@ class log_parser(log_parser_base):
         stime = time.strptime(data["when"])
         when = time.strftime("%Y-%m-%dT%H-%M-%S", stime)
         self.key_vals.append(("start_at", when))
+        # seconds since the epoch, so that queries need not parse start_at
+        self.key_vals.append(("start_t", int(time.mktime(stime))))
     def action_close_log(self, data):
         stime = time.strptime(data["when"])
         when = time.strftime("%Y-%m-%dT%H-%M-%S", stime)
         self.key_vals.append(("end_at", when))
+        self.key_vals.append(("end_t", int(time.mktime(stime))))
     def action_env(self, data):
         self.key_vals.append((data["var"], data["val"]))
     def action_train_begin(self, data):
@@ -6,9 +6,10 @@ submit execution log
 
 import argparse
 import errno
-#import json
+import json
 import os
 import pwd
+import random
 import re
 import sqlite3
 import sys
@@ -22,6 +23,12 @@ default_data_dir = ("/home/tau/public_html/lecture/"
 
 dbg = 0
 
+# seconds to wait for other submissions holding the database
+# before giving up with "database is locked", and how many times
+# to retry (with an exponential backoff) after giving up
+busy_timeout = 60.0
+busy_retries = 5
+
 # --------- nuts and bolts ---------
 
 def Ws(msg):
@@ -58,6 +65,14 @@ def do_sql(con, cmd, dbg_level, *vals):
         Es("%s with %s\n" % (cmd, vals))
     return con.execute(cmd, vals)
 
+def do_sql_many(con, cmd, dbg_level, rows):
+    """
+    do sql statement for each of rows (lists of values)
+    """
+    if dbg_level <= dbg:
+        Es("%s with %d rows\n" % (cmd, len(rows)))
+    return con.executemany(cmd, rows)
+
 def read_schema(con):
     """
     read schema of all tables
@@ -80,34 +95,92 @@ def ensure_columns(con, schema, tbl, columns):
         create_cmd = "create table if not exists {}({})".format(tbl, ",".join(columns))
         do_sql(con, create_cmd, 1)
         schema[tbl] = columns
+        ensure_indexes(con, schema, [tbl])
     else:
         existing_columns = schema[tbl]
+        n_existing_columns = len(existing_columns)
         for col in columns:
             if col not in existing_columns:
                 alt_cmd = "alter table {} add {}".format(tbl, col)
                 do_sql(con, alt_cmd, 1)
                 existing_columns.append(col)
         schema[tbl] = existing_columns
+        if len(existing_columns) > n_existing_columns:
+            ensure_indexes(con, schema, [tbl])
+
+# indexes tables have besides one on seqid, which every table
+# having seqid gets unless one of these begins with seqid
+indexes = {
+    # delete_from_db, --delete-mine and the viewer's "where owner = ..."
+    "info" : [["owner"]],
+}
+
+def table_indexes(tbl, columns):
+    """
+    list of columns of each index table TBL having COLUMNS should have
+    """
+    names = [col.split()[0] for col in columns]
+    idxs = [idx for idx in indexes.get(tbl, []) if all(col in names for col in idx)]
+    if "seqid" in names and all(idx[0] != "seqid" for idx in idxs):
+        idxs.insert(0, ["seqid"])
+    return idxs
+
+def ensure_indexes(con, schema, tbls=None):
+    """
+    ensure tables TBLS (default: all tables) have indexes
+    (see table_indexes)
+    """
+    for tbl in (tbls if tbls is not None else list(schema)):
+        for idx in table_indexes(tbl, schema[tbl]):
+            do_sql(con, "create index if not exists {}_{} on {}({})"
+                   .format(tbl, "_".join(idx), tbl, ",".join(idx)), 1)
+
+def retry_busy(con, cmd):
+    """
+    do sql statement cmd that waits for the database lock,
+    retrying a few times when it still fails after busy_timeout
+    """
+    for i in range(busy_retries + 1):
+        try:
+            return do_sql(con, cmd, 1)
+        except sqlite3.OperationalError as err:
+            if i == busy_retries or "locked" not in str(err) and "busy" not in str(err):
+                raise
+            delay = random.uniform(0.5, 1.5) * 2 ** i
+            Es("submit.py: {}, retrying in {:.1f} sec\n".format(err, delay))
+            time.sleep(delay)
+    assert(0), cmd
 
 def open_for_transaction(sqlite3_file):
     """
-    open database for transaction
+    open database for transaction.
+    the database is in WAL mode so that readers (viewers) and
+    a writer do not block each other.  the write lock is taken
+    right away (begin immediate), so that a transaction does not
+    fail in the middle when others are submitting too
     """
-    con = sqlite3.connect(sqlite3_file)
+    con = sqlite3.connect(sqlite3_file, timeout=busy_timeout)
     con.row_factory = sqlite3.Row
+    retry_busy(con, "pragma journal_mode = wal")
+    retry_busy(con, "begin immediate")
     schema = read_schema(con)
     if "seq_counter" not in schema:
         do_sql(con, "create table seq_counter(x)", 1)
         do_sql(con, "insert into seq_counter(x) values(?)", 1, 0)
     schema = read_schema(con)
+    ensure_info_times(con, schema)
+    ensure_kernel_stats(con, schema)
+    ensure_indexes(con, schema)
     return con, schema
 
 def get_next_seqid(con):
     """
-    return next seqid
+    return next seqid.
+    increment the counter first so that it is never read
+    by two submissions
     """
-    [(seqid,)] = list(do_sql(con, "select x from seq_counter", 1))
-    do_sql(con, "update seq_counter set x = ?", 1, seqid + 1)
+    do_sql(con, "update seq_counter set x = x + 1", 1)
+    [(seqid,)] = list(do_sql(con, "select x - 1 from seq_counter", 1))
     return seqid
 
 def delete_from_db(con, schema, delete_seqids, delete_mine, user):
@@ -171,12 +244,25 @@ def insert_row(con, schema, tbl, row, seqid):
 
 def insert_rows(con, schema, tbl, rows, seqid):
     """
-    insert rows into database
+    insert rows into database at once.  columns of all rows
+    are added to the table first and all rows are inserted by
+    a single statement (missing columns of a row are null)
     """
-    n_inserted = 0
+    if len(rows) == 0:
+        return 0
+    fields = ["seqid"]
+    key_sets = set()
     for row in rows:
-        n_inserted += insert_row(con, schema, tbl, row, seqid)
-    return n_inserted
+        keys = tuple(row)
+        if keys not in key_sets:
+            key_sets.add(keys)
+            fields.extend(k for k in keys if k not in fields)
+    ins_cmd = ("insert into {}({}) values({})"
+               .format(tbl, ",".join(fields), ",".join(["?"] * len(fields))))
+    ensure_columns(con, schema, tbl, fields)
+    vals = [[seqid] + [row.get(f) for f in fields[1:]] for row in rows]
+    do_sql_many(con, ins_cmd, 2, vals)
+    return len(rows)
 
 def make_row_from_key_vals(rows):
     """
@@ -191,6 +277,113 @@ def make_row_from_key_vals(rows):
         dic[row["key"]] = row["val"]
     return keys, dic
 
+class running_stat:
+    """
+    count, sum, min, max, mean, variance and a histogram
+    of values added one by one.  bucket i of the histogram
+    counts values x with 2^(i-1) <= x < 2^i (bucket 0 x < 1)
+    """
+    def __init__(self):
+        self.n = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.hist = []
+    def add(self, x):
+        """
+        add a value
+        """
+        self.n += 1
+        self.sum += x
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        bucket = int(x).bit_length() if x >= 1 else 0
+        if bucket >= len(self.hist):
+            self.hist.extend([0] * (bucket + 1 - len(self.hist)))
+        self.hist[bucket] += 1
+    def to_row(self, prefix):
+        """
+        columns of kernel_stats (PREFIX_sum etc.)
+        """
+        var = self.m2 / self.n if self.n > 0 else None
+        return {prefix + "_sum" : self.sum, prefix + "_min" : self.min,
+                prefix + "_max" : self.max, prefix + "_mean" : self.mean,
+                prefix + "_var" : var, prefix + "_hist" : json.dumps(self.hist)}
+
+def make_kernel_stats(kernel_times):
+    """
+    statistics of dt and dt per sample (dt / (b - a)) of
+    kernel_times rows of a run, per kernel and phase (t_v).
+    return rows of kernel_stats
+    """
+    stats = {}
+    for row in kernel_times:
+        dt = row["dt"]
+        n_samples = row["b"] - row["a"]
+        if dt < 0 or n_samples <= 0:
+            # the kernel did not end
+            continue
+        key = (row["cls"], row["cargs"], row["fun"], row["fargs"], row["t_v"])
+        if key not in stats:
+            stats[key] = [0, running_stat(), running_stat()]
+        stat = stats[key]
+        stat[0] += n_samples
+        stat[1].add(dt)
+        stat[2].add(dt / n_samples)
+    rows = []
+    for (cls, cargs, fun, fargs, t_v), (samples, dt, dt_per_sample) in stats.items():
+        row = dict(cls=cls, cargs=cargs, fun=fun, fargs=fargs, t_v=t_v,
+                   n=dt.n, samples=samples)
+        row.update(dt.to_row("dt"))
+        row.update(dt_per_sample.to_row("dt_per_sample"))
+        rows.append(row)
+    return rows
+
+def parse_time(st):
+    """
+    "2026-10-17T04-12-07" (start_at/end_at of info) --> seconds since
+    the epoch, or None if it is not such a string
+    """
+    try:
+        return int(time.mktime(time.strptime(st, "%Y-%m-%dT%H-%M-%S")))
+    except (TypeError, ValueError):
+        return None
+
+def ensure_info_times(con, schema):
+    """
+    fill start_t/end_t (seconds since the epoch, which parse_log
+    writes along with start_at/end_at) of runs inserted before them
+    """
+    if "info" not in schema or "start_t" in schema["info"]:
+        return
+    ensure_columns(con, schema, "info", ["start_t", "end_t"])
+    cols = schema["info"]
+    rows = []
+    for row in do_sql(con, "select * from info", 1):
+        start_t = parse_time(row["start_at"]) if "start_at" in cols else None
+        end_t = parse_time(row["end_at"]) if "end_at" in cols else None
+        rows.append((start_t, end_t, row["seqid"]))
+    do_sql_many(con, "update info set start_t = ?, end_t = ? where seqid = ?", 1, rows)
+
+def ensure_kernel_stats(con, schema):
+    """
+    compute kernel_stats of runs inserted before it was introduced
+    """
+    if "kernel_stats" in schema or "kernel_times" not in schema:
+        return
+    seqids = [row["seqid"] for row in
+              do_sql(con, "select distinct seqid from kernel_times", 1)]
+    for seqid in seqids:
+        kernel_times = do_sql(con, "select * from kernel_times where seqid = ?", 1, seqid)
+        insert_rows(con, schema, "kernel_stats", make_kernel_stats(kernel_times), seqid)
+
 def insert_into_db(con, schema, user, logs):
     """
     insert all records in plogs into database
@@ -206,6 +399,9 @@ def insert_into_db(con, schema, user, logs):
                 insert_row(con, schema, "info", dic, seqid)
             else:
                 insert_rows(con, schema, tbl, rows, seqid)
+                if tbl == "kernel_times":
+                    insert_rows(con, schema, "kernel_stats",
+                                make_kernel_stats(rows), seqid)
     return seqids
 
 def ensure_data_dir(data_dir):
@@ -290,6 +486,7 @@ def parse_args(argv):
     """
     parse command line args
     """
+    global dbg, busy_timeout, busy_retries
     psr = argparse.ArgumentParser()
     psr.add_argument("files", metavar="FILE",
                      nargs="*", help="files to submit")
@@ -310,6 +507,14 @@ def parse_args(argv):
     psr.add_argument("--delete-mine", "-D",
                      action="store_true",
                      help="delete all data of submitting user")
+    psr.add_argument("--busy-timeout", metavar="SECONDS",
+                     type=float, default=busy_timeout,
+                     help=("wait up to SECONDS for other submissions holding"
+                           " the database before retrying (default: %(default)s)"))
+    psr.add_argument("--busy-retries", metavar="N",
+                     type=int, default=busy_retries,
+                     help=("retry N times with an exponential backoff when the"
+                           " database is still locked (default: %(default)s)"))
     psr.add_argument("--dbg", type=int, default=0,
                      help="specify debug level")
     opt = psr.parse_args(argv)
@@ -327,8 +532,9 @@ def parse_args(argv):
         return None
     if len(opt.delete_seqids) == 0 and (not opt.delete_mine) and len(opt.files) == 0:
         opt.files.append("-")
-    global dbg
     dbg = opt.dbg
+    busy_timeout = opt.busy_timeout
+    busy_retries = opt.busy_retries
     return opt
 
 def main():
@@ -57,8 +57,9 @@ def run_table_div():
             (1, "batch_sz"),(1, "iters"),(1, "learnrate"),
             (1, "partial_data"),(1, "single_batch"),
             (1, "start_at"),(1, "end_at"),
-            (1, "pt(end_at) - pt(start_at) as elapsed"),
-            (1, "(pt(end_at) - pt(start_at)) / (batch_sz * iters) as tps"),
+            # start_t/end_t are seconds since the epoch, written by submit
+            (1, "end_t - start_t as elapsed"),
+            (1, "1.0 * (end_t - start_t) / (batch_sz * iters) as tps"),
             (0, "verbose"),(0, "cifar_data"),
             (0, "dropout"),(0, "validate_ratio"),(0, "validate_interval"),
             (0, "sample_seed"),(0, "weight_seed"),(0, "dropout_seed"),(0, "partial_data_seed"),
@@ -113,6 +114,8 @@ def parse_time(st):
 def sqlite_connect(a_sqlite):
     conn = sqlite3.connect(a_sqlite)
     conn.row_factory = sqlite3.Row
+    # pt(start_at) etc. are slow (a python call per row); only for
+    # expressions typed by hand.  use start_t/end_t instead
     conn.create_function("pt", 1, parse_time)
     return conn
 
@@ -332,8 +335,9 @@ def update_kernel_times_bar_chart(sql_selector_n_clicks,
         tbl = go.Figure(data=[table])
     if 1:
         # graph
-        cmd1 = ("""select {},sum(dt)/sum(b-a) as avg_dt
-        from kernel_times 
+        # read per-run statistics computed by submit (kernel_stats)
+        cmd1 = ("""select {},sum(dt_sum)/sum(samples) as avg_dt
+        from kernel_stats 
         where seqid in ({}) {}
         group by {}
         order by seqid,avg_dt desc
@@ -0,0 +1,346 @@
+#!/usr/bin/python3
+"""
+bench --- measure how fast logs are parsed and submitted
+
+generate a synthetic mnist log (see gen_log.py) and measure
+ tokenize : lines/sec of tokenizing lines (and of the linear
+            tokenizer trying all patterns in order, making sure
+            both produce the same token stream)
+ kernel   : signatures/sec of parsing kernel signatures
+            (kernel_parser, and kernel_cache remembering them)
+ parse    : lines/sec of parse_log.parse_log and parse_log.stream_log
+ ingest   : rows/sec of submit.insert_log into an empty database
+ viewer   : latency (usec) of queries the viewer (and --delete-mine)
+            issues against a database of many runs of a smaller log,
+            with the indexes submit creates and without them, and
+            of per-run ones on a partitioned database of them
+            (submit --partition), reading the selected runs' files
+ delete   : runs/sec and rows/sec of submit --delete-mine deleting
+            a fifth of runs of such a database, and how much of the
+            freed space submit --vacuum reclaims in how long (and the
+            longest step, during which the database is locked)
+
+results are appended to a file (bench_results.jsonl by default)
+along with the commit and the parameters, and compared with the
+last results of the same parameters found in it
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import gen_log
+import parse_log
+import submit
+
+benchmarks = ["tokenize", "kernel", "parse", "ingest", "viewer", "delete"]
+
+def timeit(fun, *args):
+    """
+    call fun(*args) and return (its value, elapsed seconds)
+    """
+    t0 = time.time()
+    val = fun(*args)
+    t1 = time.time()
+    return val, t1 - t0
+
+def bench_tokenize(lines):
+    """
+    lines/sec of tokenize and tokenize_linear
+    """
+    psr = parse_log.log_parser(io.StringIO(""))
+    toks_linear, dt_linear = timeit(lambda: [psr.tokenize_linear(line) for line in lines])
+    toks, dt = timeit(lambda: [psr.tokenize(line) for line in lines])
+    if toks_linear != toks:
+        for i, (x, y) in enumerate(zip(toks_linear, toks)):
+            if x != y:
+                sys.stderr.write("line %d differs: %s vs %s\n[%s]\n" % (i + 1, x, y, lines[i]))
+                break
+        raise parse_log.parse_error("tokenize and tokenize_linear disagree")
+    return {"tokenize_lines_per_sec" : len(lines) / dt,
+            "tokenize_linear_lines_per_sec" : len(lines) / dt_linear}
+
+def bench_kernel(lines):
+    """
+    signatures/sec of kernel_parser and kernel_cache
+    """
+    psr = parse_log.log_parser(io.StringIO(""))
+    sigs = []
+    for line in lines:
+        tok, data = psr.tokenize(line)
+        if tok in ["kernel_start", "kernel_end"]:
+            sigs.append(data["kernel"])
+    kpsr = parse_log.kernel_parser()
+    _, dt = timeit(lambda: [kpsr.parse(sig) for sig in sigs])
+    cache = parse_log.kernel_cache()
+    _, dt_cached = timeit(lambda: [cache.parse(sig) for sig in sigs])
+    return {"kernel_sigs_per_sec" : len(sigs) / dt,
+            "kernel_cached_sigs_per_sec" : len(sigs) / dt_cached}
+
+def bench_parse(log, n_lines):
+    """
+    lines/sec of parse_log and stream_log
+    """
+    _, dt = timeit(parse_log.parse_log, log)
+    _, dt_stream = timeit(lambda: sum(1 for _ in parse_log.stream_log(log)))
+    return {"parse_lines_per_sec" : n_lines / dt,
+            "stream_lines_per_sec" : n_lines / dt_stream}
+
+def bench_ingest(log, work_dir):
+    """
+    rows/sec of inserting log into an empty database
+    """
+    q_dir, _, _ = submit.ensure_data_dir(work_dir)
+    con, schema = submit.open_for_transaction(os.path.join(work_dir, "a.sqlite"))
+    (seqid, _), dt = timeit(submit.insert_log, con, schema, "bench", log, q_dir)
+    con.commit()
+    n_rows = 0
+    for tbl in ["samples", "loss_accuracy", "kernel_calls"]:
+        [(n,)] = list(submit.do_sql(con, "select count(*) from %s where seqid = ?" % tbl,
+                                    1, seqid))
+        n_rows += n
+    con.close()
+    return {"ingest_rows_per_sec" : n_rows / dt}
+
+def viewer_queries(seqids):
+    """
+    queries of mnist_viewer.py (and delete_from_db) on runs seqids
+    """
+    ids = ",".join(str(x) for x in seqids)
+    return [("owner", "select seqid from info where owner = 'user7'"),
+            # the default graph (samples, train_loss) of the viewer
+            ("loss", ('select samples,train_loss,seqid from loss_accuracy'
+                      ' where train_loss != "" and seqid in ({}) order by samples'
+                      .format(ids))),
+            ("kernel_stats", ("""select c.*,k.cls,k.cargs,k.fun,k.fargs from
+            (select seqid,kernel_id,sum(dt_per_sample_sum)/sum(n) as avg_dt
+             from kernel_stats where seqid in ({}) group by seqid,kernel_id) c
+            left join kernels k on c.kernel_id = k.kernel_id
+            order by seqid,avg_dt desc""".format(ids))),
+            ("kernel_times", ("select seqid,cls,fun,sum(dt)/sum(b-a) from kernel_times"
+                              " where seqid in ({}) group by seqid,cls,cargs,fun,fargs"
+                              .format(ids))),
+            ("samples", "select count(*) from samples where seqid in ({})".format(ids))]
+
+def time_queries(con, queries, repeat):
+    """
+    average usec of each of queries
+    """
+    results = {}
+    for name, cmd in queries:
+        _, dt = timeit(lambda: [list(con.execute(cmd)) for _ in range(repeat)])
+        results[name] = dt / repeat * 1.0e6
+    return results
+
+def make_runs_db(a_sqlite, run_lines, n_runs, n_users, work_dir, partition=False):
+    """
+    make a database (partitioned if partition) of n_runs runs of
+    run_lines lines each, owned by n_users users in turn.
+    return (connection, schema)
+    """
+    log = os.path.join(work_dir, "run.log")
+    with open(log, "w") as wp:
+        wp.writelines(gen_log.gen_log("mnist", n_lines=run_lines))
+    events = list(submit.event_batches(log))
+    con, schema = submit.open_for_transaction(a_sqlite)
+    if partition:
+        submit.partition_db(con, schema)
+    kernel_ids = {}
+    for i in range(n_runs):
+        submit.insert_parsed(con, schema, "user%d" % (i % n_users), events, kernel_ids, str(i))
+    submit.commit(con)
+    return con, schema
+
+def bench_viewer(run_lines, n_runs, work_dir):
+    """
+    latency of viewer queries on a database of n_runs runs of
+    run_lines lines each, with and without indexes
+    """
+    con, schema = make_runs_db(os.path.join(work_dir, "a.sqlite"),
+                               run_lines, n_runs, 50, work_dir)
+    queries = viewer_queries(range(0, n_runs, max(1, n_runs // 20)))
+    results = {}
+    for name, dt in time_queries(con, queries, 20).items():
+        results["viewer_%s_usec" % name] = dt
+    _, dt = timeit(submit.delete_from_db, con, schema, [], True, "user7")
+    con.rollback()
+    results["viewer_delete_mine_usec"] = dt * 1.0e6
+    for (idx,) in list(con.execute("select name from sqlite_master"
+                                   " where type = 'index' and sql is not null")):
+        con.execute("drop index %s" % idx)
+    for name, dt in time_queries(con, queries, 2).items():
+        results["viewer_%s_noindex_usec" % name] = dt
+    _, dt = timeit(submit.delete_from_db, con, schema, [], True, "user7")
+    results["viewer_delete_mine_noindex_usec"] = dt * 1.0e6
+    con.rollback()
+    con.close()
+    results.update(bench_partition(run_lines, n_runs, work_dir))
+    return results
+
+def bench_partition(run_lines, n_runs, work_dir):
+    """
+    latency of per-run viewer queries (and --delete-mine) on a
+    partitioned database of n_runs runs of run_lines lines each
+    """
+    con, schema = make_runs_db(os.path.join(work_dir, "p.sqlite"),
+                               run_lines, n_runs, 50, work_dir, True)
+    seqids = list(range(0, n_runs, max(1, n_runs // 20)))
+    queries = [("loss", ('select samples,train_loss,seqid from loss_accuracy'
+                         ' where train_loss != "" and seqid = ?')),
+               ("kernel_times", ("select seqid,cls,fun,sum(dt)/sum(b-a) from kernel_times"
+                                 " where seqid = ? group by seqid,cls,cargs,fun,fargs")),
+               ("samples", "select count(*) from samples where seqid = ?")]
+    results = {}
+    for name, cmd in queries:
+        _, dt = timeit(lambda: [submit.run_rows(con, schema, seqids, cmd) for _ in range(20)])
+        results["viewer_%s_partitioned_usec" % name] = dt / 20 * 1.0e6
+    submit.begin_transaction(con, schema)
+    _, dt = timeit(submit.delete_from_db, con, schema, [], True, "user7")
+    submit.commit(con)
+    results["viewer_delete_mine_partitioned_usec"] = dt * 1.0e6
+    con.close()
+    return results
+
+def db_size(a_sqlite):
+    """
+    bytes of a database and its WAL
+    """
+    return sum(os.path.getsize(f) for f in [a_sqlite, a_sqlite + "-wal"]
+               if os.path.exists(f))
+
+def bench_delete(run_lines, n_runs, work_dir):
+    """
+    throughput of deleting runs of one of five users from a database
+    of n_runs runs of run_lines lines each, and of reclaiming the
+    space afterwards
+    """
+    a_sqlite = os.path.join(work_dir, "d.sqlite")
+    con, schema = make_runs_db(a_sqlite, run_lines, n_runs, 5, work_dir)
+    n_rows = sum(con.execute("select count(*) from %s" % tbl).fetchone()[0]
+                 for tbl in schema if "seqid" in submit.schema_names(schema, tbl))
+    submit.begin_transaction(con, schema)
+    deleted, dt = timeit(submit.delete_from_db, con, schema, [], True, "user0")
+    submit.commit(con)
+    n_deleted = n_rows - sum(con.execute("select count(*) from %s" % tbl).fetchone()[0]
+                             for tbl in schema if "seqid" in submit.schema_names(schema, tbl))
+    con.execute("pragma wal_checkpoint(truncate)")
+    size = db_size(a_sqlite)
+    steps, dt_vacuum = timeit(submit.vacuum_db, con, submit.vacuum_step)
+    con.close()
+    return {"delete_runs_per_sec" : len(deleted) / dt,
+            "delete_rows_per_sec" : n_deleted / dt,
+            "delete_vacuum_mb_reclaimed" : (size - db_size(a_sqlite)) / 1.0e6,
+            "delete_vacuum_mb_per_sec" : (size - db_size(a_sqlite)) / 1.0e6 / dt_vacuum,
+            "delete_vacuum_max_step_msec" : max([0.0] + steps) * 1.0e3}
+
+def git_commit():
+    """
+    commit of the working tree this file is in, or None
+    """
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+def load_previous(results_file, params):
+    """
+    the last results in results_file measured with params
+    """
+    previous = None
+    if os.path.exists(results_file):
+        with open(results_file) as fp:
+            for line in fp:
+                record = json.loads(line)
+                if record["params"] == params:
+                    previous = record
+    return previous
+
+def parse_args(argv):
+    """
+    parse command line args
+    """
+    psr = argparse.ArgumentParser()
+    psr.add_argument("benchmarks", metavar="BENCHMARK", nargs="*",
+                     help="benchmarks to run (%s; default: all)" % ", ".join(benchmarks))
+    psr.add_argument("--lines", "-l", type=int, default=1000000,
+                     help="number of lines of the synthetic log")
+    psr.add_argument("--layers", type=int,
+                     help="number of layers, determining kernels per batch")
+    psr.add_argument("--test-batch-size", type=int,
+                     help="samples per test batch")
+    psr.add_argument("--variety", type=int, default=1,
+                     help="number of different instantiations of each kernel")
+    psr.add_argument("--runs", type=int, default=1000,
+                     help="number of runs in the database of viewer benchmark")
+    psr.add_argument("--run-lines", type=int, default=2000,
+                     help="number of lines of each run of viewer benchmark")
+    psr.add_argument("--results", "-r", default="bench_results.jsonl",
+                     help="file to append results to")
+    psr.add_argument("--no-save", action="store_true",
+                     help="do not append results to the file")
+    args = psr.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in benchmarks:
+            psr.error("unknown benchmark %s" % name)
+    if len(args.benchmarks) == 0:
+        args.benchmarks = benchmarks
+    return args
+
+def main():
+    """
+    main
+    """
+    args = parse_args(sys.argv[1:])
+    params = dict(lines=args.lines, layers=args.layers,
+                  test_batch_size=args.test_batch_size, variety=args.variety)
+    if "viewer" in args.benchmarks or "delete" in args.benchmarks:
+        params.update(runs=args.runs, run_lines=args.run_lines)
+    lines = list(gen_log.gen_log("mnist", n_lines=args.lines, n_layers=args.layers,
+                                 test_batch_size=args.test_batch_size,
+                                 variety=args.variety))
+    work_dir = tempfile.mkdtemp(prefix="bench")
+    results = {}
+    try:
+        log = os.path.join(work_dir, "mnist.log")
+        with open(log, "w") as wp:
+            wp.writelines(lines)
+        if "tokenize" in args.benchmarks:
+            results.update(bench_tokenize(lines))
+        if "kernel" in args.benchmarks:
+            results.update(bench_kernel(lines))
+        if "parse" in args.benchmarks:
+            results.update(bench_parse(log, len(lines)))
+        if "ingest" in args.benchmarks:
+            results.update(bench_ingest(log, os.path.join(work_dir, "records")))
+        if "viewer" in args.benchmarks:
+            results.update(bench_viewer(args.run_lines, args.runs, work_dir))
+        if "delete" in args.benchmarks:
+            results.update(bench_delete(args.run_lines, args.runs, work_dir))
+    finally:
+        shutil.rmtree(work_dir)
+    previous = load_previous(args.results, params)
+    print("%d lines" % len(lines))
+    for name, val in results.items():
+        if previous is not None and name in previous["results"]:
+            print("%-38s: %12.0f (%+.1f%% from %s)"
+                  % (name, val, 100.0 * (val / previous["results"][name] - 1.0),
+                     previous["commit"]))
+        else:
+            print("%-38s: %12.0f" % (name, val))
+    if not args.no_save:
+        record = dict(time=time.strftime("%Y-%m-%d %H:%M:%S"), commit=git_commit(),
+                      params=params, results=results)
+        with open(args.results, "a") as wp:
+            wp.write("%s\n" % json.dumps(record))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+"""
+check_resume --- check parsing a log resumes from its checkpoints
+
+generate a synthetic log (see gen_log.py), compress it with each
+compression parse_log accepts (gzip, xz and, if the zstandard module
+is installed, zstd) and, for a few checkpoint events of parsing it
+whole, parse it again from the checkpoint as submit -c does after
+it is killed.  then check
+ - events after the checkpoint are the same as those of the whole parse
+ - the copy of the raw log (queued by submit) is the same as the log
+"""
+
+import argparse
+import gzip
+import io
+import lzma
+import os
+import shutil
+import sys
+import tempfile
+import gen_log
+import parse_log
+
+def compress(data, compression):
+    """
+    DATA (bytes) compressed with COMPRESSION (None for as it is),
+    or None if it is not available
+    """
+    if compression is None:
+        return data
+    if compression == "gzip":
+        return gzip.compress(data)
+    if compression == "xz":
+        return lzma.compress(data)
+    assert(compression == "zstd"), compression
+    if parse_log.zstandard is None:
+        return None
+    return parse_log.zstandard.ZstdCompressor().compress(data)
+
+def parse(log, resume=None, copy=b""):
+    """
+    parse LOG (from the checkpoint RESUME if given), copying it
+    into a file having COPY already (see stream_log).
+    return the list of events and the copy
+    """
+    wp = io.BytesIO()
+    wp.write(copy)
+    wp.name = "copy"
+    events = list(parse_log.stream_log(log, resume=resume, copy=wp))
+    return events, wp.getvalue()
+
+def check_log(log, n_resumes):
+    """
+    check resuming LOG from N_RESUMES of its checkpoints.
+    return a list of problems found
+    """
+    problems = []
+    with open(log, "rb") as fp:
+        raw = fp.read()
+    events, copy = parse(log)
+    if copy != raw:
+        problems.append("%s: copied %d bytes of %d" % (log, len(copy), len(raw)))
+    ckpts = [i for i, (kind, _) in enumerate(events) if kind == "checkpoint"]
+    if len(ckpts) == 0:
+        return problems + ["%s: no checkpoints" % log]
+    # the first, the last and some in between
+    picks = sorted({ckpts[(j * (len(ckpts) - 1)) // max(1, n_resumes - 1)]
+                    for j in range(n_resumes)})
+    for i in picks:
+        ckpt = events[i][1]
+        rest, copy = parse(log, ckpt, raw[:ckpt["copy_offset"]])
+        if rest != events[i + 1:]:
+            problems.append("%s: resuming from line %d gave %d events (expected %d)"
+                            % (log, ckpt["lineno"], len(rest), len(events) - i - 1))
+        if copy != raw:
+            problems.append("%s: resuming from line %d copied %d bytes of %d"
+                            % (log, ckpt["lineno"], len(copy), len(raw)))
+    return problems
+
+def parse_args(argv):
+    """
+    parse command line args
+    """
+    psr = argparse.ArgumentParser()
+    psr.add_argument("--lines", "-l", type=int, default=20000,
+                     help="number of lines of the log")
+    psr.add_argument("--resumes", "-r", type=int, default=5,
+                     help="number of checkpoints to resume from")
+    return psr.parse_args(argv)
+
+def main():
+    """
+    main
+    """
+    args = parse_args(sys.argv[1:])
+    work_dir = tempfile.mkdtemp(prefix="resume")
+    problems = []
+    try:
+        data = "".join(gen_log.gen_log("mnist", n_lines=args.lines)).encode()
+        for compression, _, suffix in [(None, None, ".log")] + parse_log.compressions:
+            compressed = compress(data, compression)
+            if compressed is None:
+                print("%s: skipped (not available)" % compression)
+                continue
+            log = os.path.join(work_dir, "run" + suffix)
+            with open(log, "wb") as wp:
+                wp.write(compressed)
+            found = check_log(log, args.resumes)
+            print("%s: %s" % (compression, "NG" if found else "OK"))
+            problems.extend(found)
+    finally:
+        shutil.rmtree(work_dir)
+    for problem in problems:
+        print("NG: %s" % problem)
+    if len(problems) == 0:
+        print("OK")
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+"""
+gen_log --- generate a synthetic log of mnist or vgg
+
+the log is parsable by parse_log.py of 21mnist/records (mnist)
+or of 20vgg/records (vgg).  its size is determined by the number
+of epochs, batches per epoch, layers (kernels per batch), samples
+per test batch and the number of different instantiations of each
+kernel (signature variety), or by the number of lines
+"""
+
+import argparse
+import sys
+
+# (class, template params, class args, return type, param type) of
+# leaf layers of MNIST<64,1,28,28,10>.  maxB (the first arg) is
+# replaced by the batch size
+mnist_layers = [
+    ("Convolution2D", ["maxB", "IC", "H", "W", "K", "OC"], [64, 1, 28, 28, 3, 32],
+     "tensor<float, maxB, OC, ((H - K) + 1), ((W - K) + 1)>&",
+     "tensor<float, maxB, IC, H, W>&"),
+    ("Relu", ["N0", "N1", "N2", "N3"], [64, 32, 26, 26],
+     "tensor<float, N0, N1, N2, N3>&", "tensor<float, N0, N1, N2, N3>&"),
+    ("Convolution2D", ["maxB", "IC", "H", "W", "K", "OC"], [64, 32, 26, 26, 3, 64],
+     "tensor<float, maxB, OC, ((H - K) + 1), ((W - K) + 1)>&",
+     "tensor<float, maxB, IC, H, W>&"),
+    ("Relu", ["N0", "N1", "N2", "N3"], [64, 64, 24, 24],
+     "tensor<float, N0, N1, N2, N3>&", "tensor<float, N0, N1, N2, N3>&"),
+    ("MaxPooling2D", ["maxB", "C", "H", "W", "S"], [64, 64, 24, 24, 2],
+     "tensor<float, maxB, C, (H / S), (W / S)>&", "tensor<float, maxB, C, H, W>&"),
+    ("Dropout", ["N0", "N1", "N2", "N3"], [64, 64, 12, 12],
+     "tensor<float, N0, N1, N2, N3>&", "tensor<float, N0, N1, N2, N3>&"),
+    ("Linear", ["M", "N", "K0", "K1", "K2"], [64, 128, 64, 12, 12],
+     "tensor<float, M, N>&", "tensor<float, M, K0, K1, K2>&"),
+    ("Relu", ["N0", "N1", "N2", "N3"], [64, 128, 1, 1],
+     "tensor<float, N0, N1, N2, N3>&", "tensor<float, N0, N1, N2, N3>&"),
+    ("Dropout", ["N0", "N1", "N2", "N3"], [64, 128, 1, 1],
+     "tensor<float, N0, N1, N2, N3>&", "tensor<float, N0, N1, N2, N3>&"),
+    ("Linear", ["M", "N", "K0", "K1", "K2"], [64, 10, 128, 1, 1],
+     "tensor<float, M, N>&", "tensor<float, M, K0, K1, K2>&"),
+]
+
+# the same for the first block of VGG<64,3,32,32,3,2,64,10>
+vgg_layers = [
+    ("Convolution2D", ["maxB", "IC", "H", "W", "K", "OC"], [64, 3, 32, 32, 1, 64],
+     "array4<maxB, OC, H, W>&", "array4<maxB, IC, H, W>&"),
+    ("BatchNormalization", ["maxB", "IC", "H", "W"], [64, 64, 32, 32],
+     "array4<maxB, IC, H, W>&", "array4<maxB, IC, H, W>&"),
+    ("Relu", ["maxB", "C", "H", "W"], [64, 64, 32, 32],
+     "array4<maxB, C, H, W>&", "array4<maxB, C, H, W>&"),
+    ("Dropout", ["maxB", "C", "H", "W"], [64, 64, 32, 32],
+     "array4<maxB, C, H, W>&", "array4<maxB, C, H, W>&"),
+    ("Convolution2D", ["maxB", "IC", "H", "W", "K", "OC"], [64, 64, 32, 32, 1, 64],
+     "array4<maxB, OC, H, W>&", "array4<maxB, IC, H, W>&"),
+    ("BatchNormalization", ["maxB", "IC", "H", "W"], [64, 64, 32, 32],
+     "array4<maxB, IC, H, W>&", "array4<maxB, IC, H, W>&"),
+    ("Relu", ["maxB", "C", "H", "W"], [64, 64, 32, 32],
+     "array4<maxB, C, H, W>&", "array4<maxB, C, H, W>&"),
+    ("MaxPooling2D", ["maxB", "C", "H", "W", "S"], [64, 64, 32, 32, 2],
+     "array4<maxB, C, H/S, W/S>&", "array4<maxB, C, H, W>&"),
+    ("Linear", ["maxB", "IC", "nC"], [64, 512, 10],
+     "array4<maxB, nC, 1, 1>&", "array4<maxB, IC, 1, 1>&"),
+    ("SoftmaxCrossEntropy", ["maxB", "nC"], [64, 10],
+     "vec<maxB>&", "array4<maxB, nC, 1, 1>&"),
+]
+
+# layers having weights to update
+update_classes = ["Convolution2D", "Linear", "BatchNormalization"]
+
+def kernel_sig(fmt, cls, params, args, ret, arg_type, fun):
+    """
+    a kernel signature as printed by __PRETTY_FUNCTION__
+    """
+    cls_params = ", ".join(params)
+    with_ = "; ".join("int %s = %d" % (p, a) for p, a in zip(params, args))
+    fwd_params = "%s, int" % arg_type if fmt == "mnist" else arg_type
+    upd_params = "" if fmt == "mnist" else "real"
+    if fun == "forward":
+        return ("%s %s<%s>::forward(%s) [with %s]"
+                % (ret, cls, cls_params, fwd_params, with_))
+    if fun == "backward":
+        return ("%s %s<%s>::backward(%s) [with %s]"
+                % (arg_type, cls, cls_params, ret, with_))
+    return "void %s<%s>::update(%s) [with %s]" % (cls, cls_params, upd_params, with_)
+
+def gen_batch_kernels(fmt, training, batch_size, n_layers, variant):
+    """
+    signatures of kernels called in a training/test batch,
+    of n_layers layers (the table of fmt repeated as necessary).
+    variant-th instantiation of the model has variant added
+    to all class args other than the batch size
+    """
+    table = mnist_layers if fmt == "mnist" else vgg_layers
+    layers = [table[i % len(table)] for i in range(n_layers)]
+    funs = ["forward"]
+    if training:
+        funs = funs + ["backward", "update"]
+    sigs = []
+    for fun in funs:
+        for cls, params, args, ret, arg_type in layers:
+            if fun == "update" and cls not in update_classes:
+                continue
+            args = [batch_size] + [x + variant for x in args[1:]]
+            sigs.append(kernel_sig(fmt, cls, params, args, ret, arg_type, fun))
+    return sigs
+
+class log_writer:
+    """
+    make lines of a log, with increasing timestamps
+    """
+    def __init__(self):
+        self.clock = 0
+        self.n_lines = 0
+    def line(self, msg):
+        """
+        a line "NNN: msg"
+        """
+        self.clock += 1000
+        self.n_lines += 1
+        return "%d: %s\n" % (self.clock, msg)
+    def kernels(self, sigs):
+        """
+        lines of calling kernels
+        """
+        for sig in sigs:
+            yield self.line("%s: starts" % sig)
+            yield self.line("%s: ends. took %d nsec" % (sig, 100000 + self.clock % 50000))
+    def samples(self, a, b):
+        """
+        lines of predictions of samples a .. b-1
+        """
+        for s in range(a, b):
+            yield self.line("sample %d image %d pred %d truth %d" % (s, s, s % 10, (s // 3) % 10))
+
+def gen_mnist_epoch(wr, epoch, sig_sets, train_batches, test_batches,
+                    batch_size, test_batch_size):
+    """
+    lines of an epoch of mnist
+    """
+    n_train = train_batches * batch_size
+    for train_test in ["Train", "Test"]:
+        yield wr.line("%s Epoch %d starts" % (train_test, epoch))
+        training = train_test == "Train"
+        n_batches = train_batches if training else test_batches
+        bs = batch_size if training else test_batch_size
+        for batch in range(n_batches):
+            a = batch * bs
+            b = a + bs
+            train_sigs, test_sigs = sig_sets[batch % len(sig_sets)]
+            yield wr.line("%s Epoch %d batch %d (samples %d - %d) starts"
+                          % (train_test, epoch, batch, a, b))
+            yield from wr.kernels(train_sigs if training else test_sigs)
+            if not training:
+                yield wr.line("%s Epoch %d batch %d (samples %d - %d) ends"
+                              % (train_test, epoch, batch, a, b))
+            yield from wr.samples(a, b)
+            if training:
+                if batch % 10 == 0:
+                    yield wr.line("Train Epoch: %d [%d/%d (%d%%)]\tLoss: %.6f"
+                                  % (epoch, a, n_train, 100 * a // n_train, 1.0 / epoch))
+                yield wr.line("%s Epoch %d batch %d (samples %d - %d) ends"
+                              % (train_test, epoch, batch, a, b))
+        if not training:
+            n_test = test_batches * test_batch_size
+            yield wr.line("Test set: Average loss: %.4f, Accuracy: %d/%d (%d%%)"
+                          % (1.0 / epoch, n_test * 9 // 10, n_test, 90))
+        yield wr.line("%s Epoch %d ends" % (train_test, epoch))
+
+def gen_vgg_epoch(wr, epoch, sig_sets, train_batches, test_batches,
+                  batch_size, test_batch_size):
+    """
+    lines of an epoch of vgg (train_batches mini batches
+    followed by a validation of test_batches mini batches)
+    """
+    for batch in range(train_batches):
+        a = ((epoch - 1) * train_batches + batch) * batch_size
+        train_sigs, _ = sig_sets[batch % len(sig_sets)]
+        yield wr.line("=== train %d - %d ===" % (a, a + batch_size))
+        yield from wr.kernels(train_sigs)
+        yield from wr.samples(a, a + batch_size)
+        yield wr.line("train accuracy %d / %d = %.3f"
+                      % (batch_size * 9 // 10, batch_size, 0.9))
+        yield wr.line("train loss = %.9f" % (1.0 / epoch))
+    n_test = test_batches * test_batch_size
+    yield wr.line("=== validate %d - %d ===" % (0, n_test))
+    for batch in range(test_batches):
+        a = batch * test_batch_size
+        _, test_sigs = sig_sets[batch % len(sig_sets)]
+        yield from wr.kernels(test_sigs)
+        yield from wr.samples(a, a + test_batch_size)
+    yield wr.line("validate accuracy %d / %d = %.3f" % (n_test * 9 // 10, n_test, 0.9))
+    yield wr.line("validate loss = %.9f" % (1.0 / epoch))
+
+def gen_log(fmt="mnist", epochs=1, train_batches=20, test_batches=5,
+            batch_size=64, test_batch_size=None, n_layers=None,
+            variety=1, n_lines=None, env=None):
+    """
+    generate lines of a synthetic log of fmt (mnist or vgg).
+    each epoch has train_batches training batches of batch_size
+    samples and test_batches test (validation) batches of
+    test_batch_size samples.  batches call kernels of n_layers
+    layers (default: all layers of the model); kernels of batches
+    cycle through variety different instantiations.
+    with n_lines, generate as many epochs as necessary to have
+    at least n_lines lines.
+    env (a dict) has extra variables written as KEY=VAL lines
+    (e.g., to tell one generated log from another)
+    """
+    if test_batch_size is None:
+        test_batch_size = batch_size
+    table = mnist_layers if fmt == "mnist" else vgg_layers
+    if n_layers is None:
+        n_layers = len(table)
+    sig_sets = [(gen_batch_kernels(fmt, 1, batch_size, n_layers, v),
+                 gen_batch_kernels(fmt, 0, test_batch_size, n_layers, v))
+                for v in range(variety)]
+    gen_epoch = gen_mnist_epoch if fmt == "mnist" else gen_vgg_epoch
+    n_train = train_batches * batch_size
+    n_test = test_batches * test_batch_size
+    wr = log_writer()
+    yield wr.line("open a log Sat Oct 17 04:12:07 2026")
+    yield wr.line("verbose=1")
+    yield wr.line("batch-size=%d" % batch_size if fmt == "mnist" else "batch_sz=%d" % batch_size)
+    yield wr.line("epochs=%d" % epochs)
+    yield wr.line("SLURM_JOB_ID undefined")
+    for key, val in (env or {}).items():
+        yield wr.line("%s=%s" % (key, val))
+    yield wr.line("model building starts")
+    yield wr.line("model building ends")
+    if fmt == "mnist":
+        yield wr.line("loading data from data")
+        yield wr.line("use %d data items out of 60000" % n_train)
+        yield wr.line("loading data from data")
+        yield wr.line("use %d data items out of 10000" % n_test)
+    else:
+        yield wr.line("loading %d/%d training/validation data from data starts"
+                      % (n_train, n_test))
+        yield wr.line("train: %s" % " ".join("%d" % i for i in range(min(n_train, 100))))
+        yield wr.line("validate: %s" % " ".join("%d" % i for i in range(min(n_test, 100))))
+        yield wr.line("loading data ends")
+    yield wr.line("training starts")
+    epoch = 0
+    while epoch < epochs or (n_lines is not None and wr.n_lines < n_lines):
+        epoch += 1
+        yield from gen_epoch(wr, epoch, sig_sets, train_batches, test_batches,
+                             batch_size, test_batch_size)
+    yield wr.line("training ends")
+    yield wr.line("close a log Sat Oct 17 05:12:07 2026")
+
+def parse_args(argv):
+    """
+    parse command line args
+    """
+    psr = argparse.ArgumentParser()
+    psr.add_argument("--format", "-f", choices=["mnist", "vgg"], default="mnist",
+                     help="log format")
+    psr.add_argument("--epochs", "-e", type=int, default=1,
+                     help="number of epochs")
+    psr.add_argument("--lines", "-l", type=int,
+                     help="generate as many epochs as necessary to have this many lines")
+    psr.add_argument("--train-batches", type=int, default=20,
+                     help="training batches per epoch")
+    psr.add_argument("--test-batches", type=int, default=5,
+                     help="test (validation) batches per epoch")
+    psr.add_argument("--batch-size", "-b", type=int, default=64,
+                     help="samples per training batch")
+    psr.add_argument("--test-batch-size", type=int,
+                     help="samples per test batch (default: same as --batch-size)")
+    psr.add_argument("--layers", type=int,
+                     help="number of layers, determining kernels per batch (default: all of the model)")
+    psr.add_argument("--variety", type=int, default=1,
+                     help="number of different instantiations of each kernel")
+    psr.add_argument("--env", metavar="KEY=VAL", action="append", default=[],
+                     help="add variable KEY=VAL to the log (may be repeated)")
+    psr.add_argument("--output", "-o", default="-",
+                     help="output file")
+    return psr.parse_args(argv)
+
+def main():
+    """
+    main
+    """
+    args = parse_args(sys.argv[1:])
+    lines = gen_log(args.format, args.epochs, args.train_batches, args.test_batches,
+                    args.batch_size, args.test_batch_size, args.layers,
+                    args.variety, args.lines,
+                    dict(kv.split("=", 1) for kv in args.env))
+    if args.output == "-":
+        sys.stdout.writelines(lines)
+    else:
+        with open(args.output, "w") as wp:
+            wp.writelines(lines)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+"""
+ingestd --- insert logs queued by submit --enqueue into the database
+
+watch DATA/queue for tickets (X.log.json, put by submit --enqueue
+once X.log is on disk), parse the logs in a pool of worker processes
+and insert up to --batch of them in a single transaction.  inserted
+logs are moved to the store (DATA/store) as submit does.  logs that cannot be
+parsed or inserted are moved to DATA/failed along with the error (X.log.err),
+without affecting others of the batch.
+
+each inserted log is recorded in table ingested in the same
+transaction, so a log whose ticket survives a crash after the commit
+is not inserted twice.  a log identical to one already in the
+database is not parsed and removed from the queue (or, if the
+ticket says relink, its run is given to the owner of the ticket)
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+import traceback
+import submit
+
+def parse_queued(q_log):
+    """
+    parse a queued log (in a worker process).
+    return (file of events to insert (see submit.parse_events), None)
+    or (None, error message)
+    """
+    try:
+        events = submit.parse_events(q_log)
+    except Exception:           # pylint: disable=broad-except
+        return None, traceback.format_exc()
+    return events, None
+
+def list_tickets(q_dir):
+    """
+    tickets in Q_DIR, oldest first (queued files are named
+    after the time they are queued, to the microsecond; see
+    submit.open_queue_file)
+    """
+    return sorted(os.path.join(q_dir, f) for f in os.listdir(q_dir) if f.endswith(".json"))
+
+def read_ticket(ticket):
+    """
+    ticket --> (queued log, owner, relink)
+    """
+    with open(ticket) as fp:
+        info = json.load(fp)
+    return (os.path.join(os.path.dirname(ticket), info["log"]), info["owner"],
+            info.get("relink", False))
+
+def known_digests(a_sqlite, digests):
+    """
+    those of DIGESTS found in log_hashes of A_SQLITE, looked up
+    without locking the database
+    """
+    if not os.path.exists(a_sqlite):
+        return set()
+    con = sqlite3.connect(a_sqlite, timeout=submit.busy_timeout)
+    try:
+        schema = submit.read_schema(con)
+        return {digest for digest in digests
+                if submit.find_log(con, schema, digest) is not None}
+    finally:
+        con.close()
+
+def ingested_seqid(con, schema, q_log):
+    """
+    seqid q_log has been inserted as, or None
+    """
+    if "ingested" not in schema:
+        return None
+    for (seqid,) in submit.do_sql(con, "select seqid from ingested where log = ?",
+                                  1, os.path.basename(q_log)):
+        return seqid
+    return None
+
+def fail(ticket, q_log, err, f_dir):
+    """
+    move a log that cannot be inserted and its ticket to F_DIR
+    """
+    submit.Es("ingestd: {} failed\n{}".format(q_log, err))
+    with open(os.path.join(f_dir, os.path.basename(q_log) + ".err"), "w") as wp:
+        wp.write(err)
+    for path in [q_log, ticket]:
+        if os.path.exists(path):
+            os.rename(path, os.path.join(f_dir, os.path.basename(path)))
+
+def insert_queued(con, schema, owner, events, kernel_ids, digest, q_log):
+    """
+    insert a queued log Q_LOG parsed into EVENTS (see
+    submit.insert_parsed) and record it in ingested, in a savepoint
+    of the transaction.  if it fails (e.g., the log is corrupt),
+    roll back what it has inserted, leaving others in the
+    transaction as they were, and raise.  return the seqid
+    """
+    submit.do_sql(con, "savepoint queued", 1)
+    seqid = submit.get_next_seqid(con)
+    try:
+        submit.insert_parsed(con, schema, owner, submit.read_events(events),
+                             kernel_ids, digest, seqid)
+        submit.insert_rows(con, schema, "ingested", [{"log" : os.path.basename(q_log)}], seqid)
+    except Exception:
+        # its run file, kernels and columns it added are gone too
+        submit.drop_run_files(con, schema, [seqid])
+        submit.do_sql(con, "rollback to queued", 1)
+        submit.do_sql(con, "release queued", 1)
+        kernel_ids.clear()
+        schema.clear()
+        schema.update(submit.read_schema(con))
+        raise
+    submit.do_sql(con, "release queued", 1)
+    return seqid
+
+def ingest_batch(pool, a_sqlite, tickets, s_dir, f_dir):
+    """
+    parse logs of TICKETS in POOL and insert them in one transaction,
+    then move them to the store S_DIR (or F_DIR if they cannot be parsed
+    or inserted).  files are moved only after the transaction is
+    committed; if it fails, they stay in the queue.
+    the database is locked only while inserting.  parsed events
+    are kept in files, not in memory, until they are inserted.
+    return the number of logs inserted
+    """
+    queued = []
+    failed = []
+    for ticket in tickets:
+        try:
+            q_log, owner, relink = read_ticket(ticket)
+            digest = submit.log_digest(q_log)
+        except (OSError, ValueError, KeyError) as err:
+            failed.append((ticket, ticket[:-len(".json")], "bad ticket: {}\n".format(err)))
+            continue
+        queued.append((ticket, q_log, owner, relink, digest))
+    # do not parse duplicates (of logs in the database; those in
+    # this batch are found when inserting)
+    known = known_digests(a_sqlite, [digest for _, _, _, _, digest in queued])
+    jobs = [(ticket, q_log, owner, relink, digest,
+             None if digest in known else pool.apply_async(parse_queued, (q_log,)))
+            for ticket, q_log, owner, relink, digest in queued]
+    parsed = [(ticket, q_log, owner, relink, digest, (None, None) if job is None else job.get())
+              for ticket, q_log, owner, relink, digest, job in jobs]
+    kernel_ids = {}
+    inserted = []
+    duplicates = []
+    try:
+        con, schema = submit.open_for_transaction(a_sqlite)
+        try:
+            submit.ensure_columns(con, schema, "ingested", ["seqid", "log"])
+            for ticket, q_log, owner, relink, digest, (events, err) in parsed:
+                seqid = ingested_seqid(con, schema, q_log)
+                if seqid is not None:
+                    inserted.append((ticket, q_log, seqid))
+                    continue
+                seqid = submit.find_log(con, schema, digest)
+                if seqid is not None:
+                    submit.duplicate_log(con, owner, q_log, seqid, relink)
+                    duplicates.append((ticket, q_log, seqid))
+                    continue
+                if events is None and err is None:
+                    # not parsed as a duplicate, but its run has been
+                    # deleted since; left for the next batch to parse
+                    continue
+                if events is not None:
+                    try:
+                        seqid = insert_queued(con, schema, owner, events, kernel_ids,
+                                              digest, q_log)
+                    except Exception:   # pylint: disable=broad-except
+                        err = traceback.format_exc()
+                if err is None:
+                    inserted.append((ticket, q_log, seqid))
+                else:
+                    failed.append((ticket, q_log, err))
+            submit.commit(con)
+        except BaseException:
+            # nothing of the batch is inserted; its tickets stay in the queue
+            submit.rollback(con)
+            raise
+        finally:
+            con.close()
+    finally:
+        for _, _, _, _, _, (events, _) in parsed:
+            if events is not None:
+                os.remove(events)
+    # move files only now that the batch is committed
+    for ticket, q_log, err in failed:
+        fail(ticket, q_log, err, f_dir)
+    for ticket, q_log, seqid in inserted:
+        if os.path.exists(q_log):
+            submit.store_log(q_log, s_dir)
+        os.remove(ticket)
+    for ticket, q_log, seqid in duplicates:
+        os.remove(q_log)
+        os.remove(ticket)
+    if len(inserted) + len(duplicates) > 0:
+        submit.Es("ingestd: database {} updated ({} inserted: {}, {} duplicates)\n"
+                  .format(a_sqlite, len(inserted),
+                          ",".join(str(seqid) for _, _, seqid in inserted),
+                          len(duplicates)))
+    return len(inserted)
+
+def parse_args(argv):
+    """
+    parse command line args
+    """
+    psr = argparse.ArgumentParser()
+    psr.add_argument("--data", metavar="DIRECTORY",
+                     default=submit.default_data_dir,
+                     help="database directory (the same as submit --data)")
+    psr.add_argument("--workers", "-w", type=int, default=os.cpu_count(),
+                     help="number of processes parsing logs (default: number of CPUs)")
+    psr.add_argument("--batch", "-b", type=int, default=64,
+                     help="maximum number of logs inserted in a transaction")
+    psr.add_argument("--interval", "-i", metavar="SECONDS", type=float, default=1.0,
+                     help="seconds to wait for new tickets when the queue is empty")
+    psr.add_argument("--once", action="store_true",
+                     help="exit when the queue becomes empty")
+    psr.add_argument("--dbg", type=int, default=0,
+                     help="specify debug level")
+    return psr.parse_args(argv)
+
+def main():
+    """
+    main
+    """
+    args = parse_args(sys.argv[1:])
+    submit.dbg = args.dbg
+    q_dir, s_dir, _ = submit.ensure_data_dir(args.data)
+    f_dir = "{}/failed".format(args.data)
+    submit.ensure_directory(f_dir)
+    a_sqlite = "{}/a.sqlite".format(args.data)
+    with multiprocessing.Pool(args.workers) as pool:
+        while 1:
+            tickets = list_tickets(q_dir)[:args.batch]
+            if len(tickets) > 0:
+                try:
+                    ingest_batch(pool, a_sqlite, tickets, s_dir, f_dir)
+                except Exception:       # pylint: disable=broad-except
+                    # e.g., the database is still locked after retries or
+                    # the disk is full.  the tickets are tried again
+                    submit.Es("ingestd: batch failed\n{}".format(traceback.format_exc()))
+                    if args.once:
+                        return 1
+                    time.sleep(args.interval)
+            elif args.once:
+                break
+            else:
+                time.sleep(args.interval)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,7 @@ import pandas as pd
 import numpy as np
 import sqlite3
 import time
+import submit
 
 ################################################
 # the app object
@@ -57,10 +58,12 @@ def run_table_div():
     cols = [(1, "seqid"),(1, "owner"),(1, "host"),(1, "algo_s"),(1, "cuda_algo"),
             (1, "train_data_size"),(1, "epochs"),(1, "test_data_size"), 
             (1, "batch_size"),(1, "lr"),
-            (1, "start_at"), (1, "end_at"),
-            (1, "train_data_size * epochs as samples"),
-            (1, "pt(end_at) - pt(start_at) as elapsed"),
-            (1, "(train_data_size * epochs) / (pt(end_at) - pt(start_at)) as samples_per_sec"),
+            (1, "start_at"), (1, "end_at"), (0, "finished"),
+            # run_summary columns, computed by submit
+            (1, "samples"), (1, "elapsed"), (1, "samples_per_sec"), (0, "trained_samples"),
+            (0, "start_t"), (0, "end_t"),
+            (0, "final_test_accuracy"), (0, "final_test_loss"),
+            (0, "best_test_accuracy"), (0, "best_test_loss"), (0, "kernel_dt"),
             (0, "verbose"),(0, "data_dir"),
             (0, "dropout_seed_1"), (0, "dropout_seed_2"),
             (0, "weight_seed"), 
@@ -99,7 +102,7 @@ def run_table_div():
                               options=[{"label" : "{}, ".format(x), "value" : x} for x in all_cols],
                               value=on_cols),
                 dcc.Input(id="sql_selected2", value="")]),
-        html.P(["from info where ", dcc.Input(id="sql_where")]),
+        html.P(["from info_all join run_summary using (seqid) where ", dcc.Input(id="sql_where")]),
         html.P(["group by ", dcc.Input(id="sql_group_by")]),
         html.P(["order by", dcc.Input(id="sql_order_by", value="samples_per_sec  desc")]),
         html.P(["limit ", dcc.Input(id="sql_limit", value="100")]),
@@ -118,16 +121,27 @@ def parse_time(st):
 def sqlite_connect(a_sqlite):
     conn = sqlite3.connect(a_sqlite)
     conn.row_factory = sqlite3.Row
+    # pt(start_at) etc. are slow (a python call per row); only for
+    # expressions typed by hand.  use start_t/end_t of run_summary instead
     conn.create_function("pt", 1, parse_time)
     return conn
 
+def run_rows(conn, seqids, cmd):
+    """
+    rows of query cmd (having "seqid = ?") on each of seqids.
+    runs having a file of their own (submit --partition) are read
+    from it, so that the cost depends on the runs selected, not
+    on how many runs are in the database (see submit.run_rows)
+    """
+    return submit.run_rows(conn, submit.read_schema(conn), seqids, cmd)
+
 def build_sql(selected, selected2, where, group_by, order_by, limit):
     where = "where {}".format(where) if where else ""
     group_by = "group by {}".format(group_by) if group_by else ""
     order_by = "order by {}".format(order_by) if order_by else ""
     selected2 = [x for x in selected2.strip().split(",") if x != ""]
     limit = "limit {}".format(limit) if limit != "" else ""
-    cmd = ("select {} from info {} {} {} {}"
+    cmd = ("select {} from info_all join run_summary using (seqid) {} {} {} {}"
            .format(",".join(selected + selected2), where, group_by, order_by, limit))
     return cmd
 
@@ -198,9 +212,11 @@ def update_loss_accuracy_graph(selected_x, selected_y, n_clicks, selected, selec
     conn = sqlite_connect(a_sqlite)
     cmd = build_sql(selected, selected2, where, group_by, order_by, limit)
     seqids = [row["seqid"] for row in do_sql(conn, cmd)]
-    cmdx = ('select {x},{y},seqid from loss_accuracy where {y} != "" and seqid in ({ids}) order by {x}'
-            .format(x=selected_x, y=selected_y, ids=",".join([str(x) for x in seqids])))
-    result = list(do_sql(conn, cmdx))
+    # rows of each run ordered by x (sqlite puts numbers before ""),
+    # as each run is drawn as a line of its own
+    cmdx = ('select {x},{y},seqid from loss_accuracy where {y} != "" and seqid = ? order by {x}'
+            .format(x=selected_x, y=selected_y))
+    result = run_rows(conn, seqids, cmdx)
     conn.close()
     x = [row[selected_x] for row in result]
     y = [row[selected_y] for row in result]
@@ -224,14 +240,17 @@ def kernel_times_table_div():
 #    Input( "sql_selector", "value"),
 #)
 def update_kernel_times_table(kernel_times_table_cond):
-    conn = sqlite3.connect(a_sqlite)
-    where = "where {}".format(kernel_times_table_cond) if kernel_times_table_cond else ""
+    conn = sqlite_connect(a_sqlite)
+    where = "and ({})".format(kernel_times_table_cond) if kernel_times_table_cond else ""
     cols = ["seqid", "cls", "cargs", "fun", "fargs", "sum(t1-t0)", "sum(dt)"]
     cmd = ("""select {} from kernel_times 
-    {}
+    where seqid = ? {}
     group by seqid,cls,cargs,fun,fargs"""
            .format(",".join(cols), where))
-    result = list(do_sql(conn, cmd))
+    # kernel_calls of runs in files of their own are not in the
+    # kernel_times view of a.sqlite; read them run by run
+    seqids = [row["seqid"] for row in do_sql(conn, "select seqid from info order by seqid")]
+    result = run_rows(conn, seqids, cmd)
     conn.close()
     cells = [[row[i] for row in result] for i in range(len(cols))]
     table = go.Table(header=dict(values=cols), cells=dict(values=cells))
@@ -310,7 +329,7 @@ def make_kernel_name(row, group_by):
 def update_kernel_times_bar_chart(sql_selector_n_clicks, 
                                   selected, selected2, where, group_by, order_by, limit):
     kernel_times_where = ""
-    kernel_times_group_by = "cls,cargs,fun,fargs"
+    kernel_times_group_by = "kernel_id"
     conn = sqlite_connect(a_sqlite)
     cmd = build_sql(selected, selected2, where, group_by, order_by, limit)
     #print("cmd=", cmd)
@@ -338,10 +357,14 @@ def update_kernel_times_bar_chart(sql_selector_n_clicks,
         tbl = go.Figure(data=[table])
     if 1:
         # graph
-        cmd1 = ("""select {},avg(dt /(b-a)) as avg_dt
-        from kernel_times 
-        where seqid in ({}) {}
-        group by {}
+        # read per-run statistics computed by submit (kernel_stats)
+        # and look up kernel names afterwards
+        cmd1 = ("""select c.*,k.cls,k.cargs,k.fun,k.fargs from
+        (select {},sum(dt_per_sample_sum)/sum(n) as avg_dt
+         from kernel_stats 
+         where seqid in ({}) {}
+         group by {}) c
+        left join kernels k on c.kernel_id = k.kernel_id
         order by seqid,avg_dt desc
         """.format(kernel_times_group_by, ",".join([str(x) for x in seqids]),
                    kernel_times_where,
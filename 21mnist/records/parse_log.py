@@ -2,12 +2,24 @@
 """
 parse_log
 """
+import array
 import csv
+import gzip
+import io
 import json
+import locale
+import lzma
+import mmap
+import multiprocessing
+import os
 import re
 import sys
 import time
 #import pdb
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 class parse_error(Exception):
     """
@@ -53,10 +65,81 @@ class log_parser_base:
         pat_time = r"(?P<t>\d+): "
         self.patterns = {tok : re.compile(pat_time + pat) for tok, pat in tokens.items()}
         self.patterns["EOF"] = re.compile("^$")
-        self.kpsr = kernel_parser()
+        # tokens that can only match when the line (after "NNN: ")
+        # begins with the given word.  all other tokens (env and
+        # kernel_start/end) are tried on every line
+        keywords = {
+            "open"     : ["open_log"],
+            "close"    : ["close_log"],
+            "model"    : ["model_start", "model_end"],
+            "loading"  : ["load_start"],
+            "use"      : ["load_end"],
+            "training" : ["training_start", "training_end"],
+            "Train"    : ["train_epoch_start", "train_epoch_end",
+                          "train_batch_start", "train_batch_end", "train_loss"],
+            "Test"     : ["test_epoch_start", "test_epoch_end",
+                          "test_batch_start", "test_batch_end", "test_loss"],
+            "sample"   : ["sample"],
+        }
+        self.keywords = {kw : set(toks) for kw, toks in keywords.items()}
+        # "NNN: " followed by the leading word; env tells whether
+        # the line may be a "var=val" or "var undefined" line
+        self.head_pattern = re.compile(pat_time + r"(?P<key>[A-Za-z0-9_\-]*)(?P<env>=| undefined)?")
+        self.body_patterns = [(tok, re.compile(pat)) for tok, pat in tokens.items()]
+        self.candidates = {}
+        self.kcache = kernel_signatures
         self.lines = []
+        self.lineno = 0
+        # where parse_file_steps is (header, train or test)
+        self.resume_point = None
         self.next_line()
 
+    def get_candidates(self, key, env):
+        """
+        token patterns that may match a line beginning with key,
+        in the same order as self.patterns
+        """
+        cands = self.candidates.get((key, env))
+        if cands is None:
+            toks = self.keywords.get(key, set())
+            cands = [(tok, regex) for tok, regex in self.body_patterns
+                     if tok in toks
+                     or (tok == "env" and env)
+                     or tok in ["kernel_start", "kernel_end"]]
+            self.candidates[key, env] = cands
+        return cands
+    def tokenize(self, line):
+        """
+        return (token kind, data) of line.
+        strip "NNN: " once and only try patterns that
+        may match the leading word of the rest
+        """
+        head = self.head_pattern.match(line)
+        if head is None:
+            if self.patterns["EOF"].match(line):
+                return "EOF", {}
+            return None, None
+        key = head.group("key")
+        env = key != "" and head.group("env") is not None
+        pos = head.start("key")
+        for tok, regex in self.get_candidates(key, env):
+            match = regex.match(line, pos)
+            if match:
+                data = {"t" : head.group("t")}
+                data.update(match.groupdict())
+                return tok, data
+        return None, None
+    def tokenize_linear(self, line):
+        """
+        return (token kind, data) of line, trying all
+        patterns in order.  slow; kept as the reference
+        tokenize must agree with
+        """
+        for tok, regex in self.patterns.items():
+            match = regex.match(line)
+            if match:
+                return tok, match.groupdict()
+        return None, None
     def next_line(self):
         """
         get next line, set token kind
@@ -65,15 +148,9 @@ class log_parser_base:
         if self.line != "":
             #print(self.line.strip())
             self.lines.append(self.line)
-        for tok, regex in self.patterns.items():
-            match = regex.match(self.line)
-            if match:
-                self.tok = tok
-                self.data = match.groupdict()
-                # print("  [{}] {}".format(self.tok, self.data))
-                return
-        self.tok = None
-        self.data = None
+            self.lineno += 1
+        self.tok, self.data = self.tokenize(self.line)
+        # print("  [{}] {}".format(self.tok, self.data))
     def call_action(self, tok):
         """
         call callback defined in subclasses
@@ -96,18 +173,18 @@ class log_parser_base:
         raise parse error
         """
         raise parse_error("%s:%d:error: expected %s but got %s\n[%s]\n" %
-                          (self.fp.name, len(self.lines), tok, self.tok, self.line))
+                          (getattr(self.fp, "name", ""), self.lineno, tok, self.tok, self.line))
     def parse_kernel_start(self):
         """
         ...: starts
         """
-        self.kpsr.parse(self.data["kernel"])
+        self.kcache.parse(self.data["kernel"])
         self.eat("kernel_start")
     def parse_kernel_end(self):
         """
         ...: ends. took ... nsec
         """
-        self.kpsr.parse(self.data["kernel"])
+        self.kcache.parse(self.data["kernel"])
         self.eat("kernel_end")
     def parse_train_batch(self):
         """
@@ -144,29 +221,37 @@ class log_parser_base:
             self.eat("test_batch_end")
         if self.tok == "test_loss":
             self.eat("test_loss")
-    def parse_train_epoch(self):
+    def parse_train_epoch(self, resume=False):
         """
         227997219: Train Epoch x starts
           228023464: Train Epoch x batch y (samples a - b) starts
           ...
           228023464: Train Epoch x batch y (samples a - b) ends
         227997219: Train Epoch x ends
+        yield after each batch.  with resume, start after a batch
         """
-        self.eat("train_epoch_start")
+        if not resume:
+            self.eat("train_epoch_start")
+        self.resume_point = "train"
         while self.tok == "train_batch_start":
             self.parse_train_batch()
+            yield
         self.eat("train_epoch_end")
-    def parse_test_epoch(self):
+    def parse_test_epoch(self, resume=False):
         """
         227997219: Train Epoch x starts
           228023464: Train Epoch x batch y (samples a - b) starts
           ...
           228023464: Train Epoch x batch y (samples a - b) ends
         227997219: Train Epoch x ends
+        yield after each batch.  with resume, start after a batch
         """
-        self.eat("test_epoch_start")
+        if not resume:
+            self.eat("test_epoch_start")
+        self.resume_point = "test"
         while self.tok == "test_batch_start":
             self.parse_test_batch()
+            yield
         self.eat("test_epoch_end")
     def parse_validate(self):
         """
@@ -182,6 +267,34 @@ class log_parser_base:
         """
         other* train_or_validate* EOF
         """
+        for _ in self.parse_file_steps():
+            pass
+    def parse_file_steps(self, resume=None):
+        """
+        parse_file, yielding after the header, after each
+        batch and at the end of file.  resume is the resume_point
+        of a previous parse when it resumes from there
+        """
+        if resume is None:
+            self.parse_header()
+            self.resume_point = "header"
+            yield
+        elif resume == "train":
+            yield from self.parse_train_epoch(True)
+            yield from self.parse_test_epoch()
+        elif resume == "test":
+            yield from self.parse_test_epoch(True)
+        else:
+            assert(resume == "header"), resume
+        while self.tok == "train_epoch_start":
+            yield from self.parse_train_epoch()
+            yield from self.parse_test_epoch()
+        self.parse_trailer()
+        yield
+    def parse_header(self):
+        """
+        open a log ... training starts
+        """
         self.eat("open_log")
         while self.tok == "env":
             self.eat("env")
@@ -192,12 +305,29 @@ class log_parser_base:
         self.eat("load_start")
         self.eat("load_end")
         self.eat("training_start")
-        while self.tok == "train_epoch_start":
-            self.parse_train_epoch()
-            self.parse_test_epoch()
+    def parse_trailer(self):
+        """
+        training ends ... close a log EOF
+        """
         self.eat("training_end")
         self.eat("close_log")
         self.eat("EOF")
+    def parse_chunk(self, first, last):
+        """
+        part of a file cut at "Train Epoch N starts" lines.
+        header? (train_epoch test_epoch)* trailer?
+        """
+        if first:
+            self.parse_header()
+        while self.tok == "train_epoch_start":
+            for _ in self.parse_train_epoch():
+                pass
+            for _ in self.parse_test_epoch():
+                pass
+        if last:
+            self.parse_trailer()
+        else:
+            self.eat("EOF")
 
 class kernel_parser:
     """
@@ -434,6 +564,179 @@ class kernel_parser:
         self.init(s)
         return self.parse_kernel_sig()
 
+class kernel_cache:
+    """
+    parsed kernel signatures and their instantiations
+    (cls, cargs, fun, fargs), keyed by the raw signature string.
+    a run has a few dozen distinct kernels called hundreds of
+    thousands of times, so each is parsed and evaluated once.
+    holds at most max_entries signatures; the oldest is dropped
+    when full
+    """
+    def __init__(self, max_entries=1024):
+        self.kpsr = kernel_parser()
+        self.max_entries = max_entries
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def lookup(self, sig):
+        """
+        [parsed kernel, instantiation or None] of sig
+        """
+        entry = self.entries.get(sig)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = [self.kpsr.parse(sig), None]
+        if len(self.entries) >= self.max_entries:
+            del self.entries[next(iter(self.entries))]
+            self.evictions += 1
+        self.entries[sig] = entry
+        return entry
+    def parse(self, sig):
+        """
+        parse a kernel signature
+        """
+        return self.lookup(sig)[0]
+    def instantiate(self, sig):
+        """
+        (class name, class arg values, fun name, fun arg values)
+        of a kernel signature
+        """
+        entry = self.lookup(sig)
+        if entry[1] is None:
+            entry[1] = self.instantiate_kernel(entry[0])
+        return entry[1]
+    def stats(self):
+        """
+        hit/miss counters
+        """
+        return dict(entries=len(self.entries), hits=self.hits,
+                    misses=self.misses, evictions=self.evictions)
+    def eval_template_arg(self, expr, env):
+        """
+        evaluate template arg
+        """
+        if isinstance(expr, type("")):
+            # variable
+            _, val = env[expr]
+            return val
+        if isinstance(expr, type(0)):
+            # number
+            return expr
+        if isinstance(expr, type(())):
+            # (op, e0, e1)
+            operator, expr0, expr1 = expr
+            val0 = self.eval_template_arg(expr0, env)
+            val1 = self.eval_template_arg(expr1, env)
+            if operator == "+":
+                val = val0 + val1
+            if operator == "-":
+                val = val0 - val1
+            if operator == "*":
+                val = val0 * val1
+            if operator == "/":
+                val = val0 / val1
+            assert(operator in ["+", "-", "*", "/", "%"]), operator
+            return val
+        assert(0), expr
+        return None
+    def instantiate_kernel(self, kernel):
+        """
+        instantiate kernel
+        """
+        # return_type = kernel["return_type"]
+        class_fun = kernel["class_fun"]
+        # params = kernel["params"]
+        insts = kernel["instantiations"]
+        class_name = class_fun["class_name"]
+        class_args = class_fun["class_args"]
+        fun_name = class_fun["fun_name"]
+        fun_args = class_fun["fun_args"]
+        if class_args is None:
+            class_arg_vals = None
+        else:
+            class_arg_vals = [self.eval_template_arg(arg, insts) for arg in class_args]
+        if fun_args is None:
+            fun_arg_vals = None
+        else:
+            fun_arg_vals = [self.eval_template_arg(arg, insts) for arg in fun_args]
+        return (class_name, class_arg_vals, fun_name, fun_arg_vals)
+
+kernel_signatures = kernel_cache()
+
+class kernel_records:
+    """
+    kernel invocations of a log, kept in typed column arrays
+    (about 40 bytes per invocation).  signatures are interned;
+    sig_ids holds the index of each invocation's signature in sigs
+    """
+    phases = ["train", "test"]
+    def __init__(self):
+        self.sigs = []
+        self.sig_idx = {}
+        self.t0 = array.array("q")
+        self.t1 = array.array("q")
+        self.dt = array.array("q")
+        self.sig_ids = array.array("H")
+        self.phase = array.array("b")
+        self.a = array.array("q")
+        self.b = array.array("q")
+    def __len__(self):
+        return len(self.t0)
+    def intern(self, sig):
+        """
+        index of signature sig in self.sigs
+        """
+        idx = self.sig_idx.get(sig)
+        if idx is None:
+            idx = len(self.sigs)
+            self.sigs.append(sig)
+            self.sig_idx[sig] = idx
+        return idx
+    def start(self, t0, sig, train_test, a, b):
+        """
+        record the start of a kernel.
+        t1 and dt are -1 until end is called
+        """
+        self.t0.append(t0)
+        self.t1.append(-1)
+        self.dt.append(-1)
+        self.sig_ids.append(self.intern(sig))
+        self.phase.append(self.phases.index(train_test))
+        self.a.append(a)
+        self.b.append(b)
+    def end(self, t1, sig, dt):
+        """
+        record the end of the last kernel started
+        """
+        assert(self.t1[-1] == -1), (sig, self.t1[-1])
+        assert(self.sigs[self.sig_ids[-1]] == sig), (sig, self.sigs[self.sig_ids[-1]])
+        assert(self.dt[-1] == -1), (sig, self.dt[-1])
+        self.t1[-1] = t1
+        self.dt[-1] = dt
+    def extend(self, other):
+        """
+        append all records of other
+        """
+        ids = [self.intern(sig) for sig in other.sigs]
+        self.t0.extend(other.t0)
+        self.t1.extend(other.t1)
+        self.dt.extend(other.dt)
+        self.sig_ids.extend(ids[i] for i in other.sig_ids)
+        self.phase.extend(other.phase)
+        self.a.extend(other.a)
+        self.b.extend(other.b)
+    def __iter__(self):
+        """
+        (t0, t1, sig, dt, train_test, a, b) of each invocation
+        """
+        for t0, t1, i, dt, ph, a, b in zip(self.t0, self.t1, self.sig_ids, self.dt,
+                                           self.phase, self.a, self.b):
+            yield (t0, t1, self.sigs[i], dt, self.phases[ph], a, b)
+
 class log_parser(log_parser_base):
     """
     log parser
@@ -444,8 +747,10 @@ class log_parser(log_parser_base):
         self.phase = None
         self.n_training_samples = 0
         self.loss_acc = []
-        self.kernels = []
+        self.kernels = kernel_records()
         self.key_vals = []
+        # batches already handed out by drain_events
+        self.n_drained_batches = 0
     def action_open_log(self, data):
         stime = time.strptime(data["when"])
         when = time.strftime("%Y-%m-%dT%H-%M-%S", stime)
@@ -505,24 +810,16 @@ class log_parser(log_parser_base):
         """
         action on kernel start
         """
-        kernel = self.kpsr.parse(data["kernel"])
+        kernel = data["kernel"]
         train_test, a, b = self.phase
-        # start time, end time, kernel info, elapsed time, train/validate, sample_idx0, sample_idx1
-        self.kernels.append((int(data["t"]), None, kernel, None, train_test, a, b))
+        self.kernels.start(int(data["t"]), kernel, train_test, a, b)
     def action_kernel_end(self, data):
         """
         action on kernel end
         """
-        kernel = self.kpsr.parse(data["kernel"])
+        kernel = data["kernel"]
         kernel_time = int(data["kernel_time"])
-        ker1 = self.kernels[-1]
-        t0, t1, ks, kt, train_test, a, b = ker1
-        assert(t1 is None), ker1
-        assert(ks == kernel), ker1
-        assert(kt is None), ker1
-        t1 = int(data["t"])
-        kt = kernel_time
-        self.kernels[-1] = (t0, t1, ks, kt, train_test, a, b)
+        self.kernels.end(int(data["t"]), kernel, kernel_time)
     def get_key_vals(self):
         """
         get environment variables
@@ -536,23 +833,36 @@ class log_parser(log_parser_base):
         get samples
         """
         jsn = []
-        for i, (train_test, samples) in enumerate(self.samples):
+        for i, (train_test, samples) in enumerate(self.samples, self.n_drained_batches):
             for s in samples:
                 jsn.append(dict(iter=i, train_test=train_test, **s))
         return jsn
-    def get_kernel_times(self):
+    def get_kernel_names(self):
         """
-        get kernel times
+        (cls, "<cargs>", fun, "<fargs>") of each signature in self.kernels
         """
-        jsn = []
-        for t0, t1, kernel, dt, train_test, a, b in self.kernels:
-            cls, cargs, fun, fargs = self.instantiate(kernel)
+        names = []
+        for sig in self.kernels.sigs:
+            cls, cargs, fun, fargs = self.kcache.instantiate(sig)
             if cargs is not None:
                 cargs = "<%s>" % ",".join("%s" % x for x in cargs)
             if fargs is not None:
                 fargs = "<%s>" % ",".join("%s" % x for x in fargs)
+            names.append((cls, cargs, fun, fargs))
+        return names
+    def get_kernel_times(self):
+        """
+        get kernel times
+        """
+        names = self.get_kernel_names()
+        phases = kernel_records.phases
+        krs = self.kernels
+        jsn = []
+        for t0, t1, i, dt, ph, a, b in zip(krs.t0, krs.t1, krs.sig_ids, krs.dt,
+                                           krs.phase, krs.a, krs.b):
+            cls, cargs, fun, fargs = names[i]
             jsn.append(dict(t0=t0, t1=t1, cls=cls, cargs=cargs, fun=fun, fargs=fargs, dt=dt,
-                            train_test=train_test, a=a, b=b))
+                            train_test=phases[ph], a=a, b=b))
         return jsn
     def get_loss_accuracy(self):
         """
@@ -581,6 +891,82 @@ class log_parser(log_parser_base):
         return jsn
     def get_all_data(self):
         return "".join(self.lines)
+    def get_state(self):
+        """
+        records parsed so far, to be merged by merge_state
+        of the parser of the preceding part of the log
+        """
+        return (self.key_vals, self.samples, self.n_training_samples,
+                self.loss_acc, self.kernels)
+    def merge_state(self, state):
+        """
+        append records of the following part of the log
+        parsed by another parser (see get_state)
+        """
+        key_vals, samples, n_training_samples, loss_acc, kernels = state
+        self.key_vals.extend(key_vals)
+        # iter of samples is the index in self.samples
+        self.samples.extend(samples)
+        # training samples in loss_acc count from the start of the part
+        for samples_, kind, t, loss, acc in loss_acc:
+            self.loss_acc.append((self.n_training_samples + samples_, kind, t, loss, acc))
+        self.n_training_samples += n_training_samples
+        self.kernels.extend(kernels)
+    def drain_events(self):
+        """
+        events for records parsed since the last call, in the
+        same shapes as get_key_vals etc.  records (and lines) are
+        forgotten once returned, so memory does not grow with the log
+        """
+        # the line just read ahead is handed out with the next events
+        if self.line != "":
+            self.lines.pop()
+        events = [("raw", self.get_all_data())]
+        events.extend(("env", x) for x in self.get_key_vals())
+        events.extend(("kernel", x) for x in self.get_kernel_times())
+        events.extend(("sample", x) for x in self.get_samples())
+        events.extend(("loss", x) for x in self.get_loss_accuracy())
+        for i, (train_test, _) in enumerate(self.samples, self.n_drained_batches):
+            events.append(("batch", dict(iter=i, train_test=train_test,
+                                         n_training_samples=self.n_training_samples)))
+        self.n_drained_batches += len(self.samples)
+        self.lines = [self.line] if self.line != "" else []
+        self.key_vals = []
+        self.kernels = kernel_records()
+        self.samples = []
+        self.loss_acc = []
+        return events
+    def get_checkpoint(self):
+        """
+        what is needed to resume parsing from the line just read
+        ahead (after drain_events).  fp must be a log_reader
+        """
+        return dict(offset=self.fp.line_offset, lineno=self.lineno - 1,
+                    resume_point=self.resume_point,
+                    n_training_samples=self.n_training_samples,
+                    n_batches=self.n_drained_batches)
+    def restore_checkpoint(self, ckpt):
+        """
+        restore the state saved by get_checkpoint.
+        fp must have been positioned at ckpt["offset"]
+        """
+        self.lineno = ckpt["lineno"] + self.lineno
+        self.n_training_samples = ckpt["n_training_samples"]
+        self.n_drained_batches = ckpt["n_batches"]
+        self.resume_point = ckpt["resume_point"]
+    def events(self, resume=None):
+        """
+        parse the file and generate (kind, data) events as it goes.
+        kind is one of raw (log text), env, kernel, sample, loss,
+        batch (end of a batch) and checkpoint (see get_checkpoint;
+        not after the last events).  with resume (a checkpoint
+        restored by restore_checkpoint), resume from there
+        """
+        point = None if resume is None else resume["resume_point"]
+        for _ in self.parse_file_steps(point):
+            yield from self.drain_events()
+            if self.tok != "EOF" or self.line != "":
+                yield ("checkpoint", self.get_checkpoint())
     def write_samples_csv(self, filename):
         """
         write samples into csv
@@ -591,55 +977,6 @@ class log_parser(log_parser_base):
             for i, (train_test, samples) in enumerate(self.samples):
                 for s in samples:
                     csv_wp.writerow(dict(iter=i, train_test=train_test, **s))
-    def eval_template_arg(self, expr, env):
-        """
-        evaluate template arg
-        """
-        if isinstance(expr, type("")):
-            # variable
-            _, val = env[expr]
-            return val
-        if isinstance(expr, type(0)):
-            # number
-            return expr
-        if isinstance(expr, type(())):
-            # (op, e0, e1)
-            operator, expr0, expr1 = expr
-            val0 = self.eval_template_arg(expr0, env)
-            val1 = self.eval_template_arg(expr1, env)
-            if operator == "+":
-                val = val0 + val1
-            if operator == "-":
-                val = val0 - val1
-            if operator == "*":
-                val = val0 * val1
-            if operator == "/":
-                val = val0 / val1
-            assert(operator in ["+", "-", "*", "/", "%"]), operator
-            return val
-        assert(0), expr
-        return None
-    def instantiate(self, kernel):
-        """
-        instantiate kernel
-        """
-        # return_type = kernel["return_type"]
-        class_fun = kernel["class_fun"]
-        # params = kernel["params"]
-        insts = kernel["instantiations"]
-        class_name = class_fun["class_name"]
-        class_args = class_fun["class_args"]
-        fun_name = class_fun["fun_name"]
-        fun_args = class_fun["fun_args"]
-        if class_args is None:
-            class_arg_vals = None
-        else:
-            class_arg_vals = [self.eval_template_arg(arg, insts) for arg in class_args]
-        if fun_args is None:
-            fun_arg_vals = None
-        else:
-            fun_arg_vals = [self.eval_template_arg(arg, insts) for arg in fun_args]
-        return (class_name, class_arg_vals, fun_name, fun_arg_vals)
     def xxx_write_kernel_times_csv(self, filename):
         """
         write kernel_times into csv
@@ -648,7 +985,7 @@ class log_parser(log_parser_base):
             csv_wp = csv.DictWriter(wp, ["t0", "t1", "cls", "cargs", "fun", "fargs", "dt"])
             csv_wp.writeheader()
             for t0, t1, kernel, dt, train_test, a, b in self.kernels:
-                cls, cargs, fun, fargs = self.instantiate(kernel)
+                cls, cargs, fun, fargs = self.kcache.instantiate(kernel)
                 if cargs is not None:
                     cargs = "<%s>" % ",".join("%s" % x for x in cargs)
                 if fargs is not None:
@@ -680,14 +1017,321 @@ class log_parser(log_parser_base):
                 if kind == "train_accuracy":
                     data["t"] = t
 
-def parse_log(log):
+def get_meta():
+    """
+    class names
+    """
+    classes = ["airplane", "automobile", "bird", "cat",
+               "deer", "dog", "frog", "horse", "ship", "truck"]
+    return [{"class": x} for x in classes]
+
+class log_reader:
+    """
+    read lines of a log opened in binary mode as text,
+    keeping the byte offset of the last line returned
+    (line_offset) so parsing can later resume from there.
+    with follow, the log is still being written (like tail -f);
+    readline waits until a whole line is available, and returns ""
+    once the file ends after "close a log" or has not grown for
+    timeout seconds (the program probably died).
+    with skip, fp is not seeked to offset but the bytes before
+    it are read and thrown away (fp is a decompressed stream,
+    which cannot seek or would decompress them anyway)
+    """
+    def __init__(self, fp, offset=0, follow=False, interval=1.0, timeout=600.0, skip=False):
+        self.fp = fp
+        self.name = getattr(fp, "name", "")
+        self.encoding = locale.getpreferredencoding(False)
+        if offset and skip:
+            self.skip(offset)
+        elif offset:
+            fp.seek(offset)
+        self.offset = offset
+        self.line_offset = offset
+        self.follow = follow
+        self.interval = interval
+        self.timeout = timeout
+        self.close_pattern = re.compile(r"\d+: close a log ")
+        self.closed = False
+    def skip(self, n):
+        """
+        read and throw away the first n bytes of fp
+        """
+        left = n
+        while left > 0:
+            data = self.fp.read(min(left, 1 << 20))
+            if data == b"":
+                raise parse_error("%s ends before offset %d to resume from" % (self.name, n))
+            left -= len(data)
+    def readline(self):
+        """
+        next whole line
+        """
+        self.line_offset = self.offset
+        line = b""
+        idle = 0.0
+        while True:
+            raw = self.fp.readline()
+            self.offset += len(raw)
+            line += raw
+            if line.endswith(b"\n"):
+                break
+            if not self.follow or self.closed or idle >= self.timeout:
+                break
+            if raw != b"":
+                idle = 0.0
+            time.sleep(self.interval)
+            idle += self.interval
+        line = line.decode(self.encoding).replace("\r\n", "\n")
+        if line != "":
+            self.closed = self.close_pattern.match(line) is not None
+        return line
+
+# compressed logs are recognized by their first bytes
+# (compression, magic bytes, suffix)
+compressions = [
+    ("gzip", b"\x1f\x8b",             ".log.gz"),
+    ("xz",   b"\xfd7zXZ\x00",         ".log.xz"),
+    ("zstd", b"\x28\xb5\x2f\xfd",     ".log.zst"),
+]
+
+def open_raw_log(log):
     """
-    parse a log
+    open a log ("-" for stdin) in binary mode, as it is
     """
     if log == "-":
-        fp = sys.stdin
-    else:
-        fp = open(log)
+        return sys.stdin.buffer
+    return open(log, "rb")
+
+def log_compression(fp):
+    """
+    (compression, suffix) of a log opened by open_raw_log,
+    judged by its first bytes without consuming them.
+    (None, ".log") if it is not compressed
+    """
+    magic = fp.peek(8)[:8]
+    for compression, prefix, suffix in compressions:
+        if magic.startswith(prefix):
+            return compression, suffix
+    return None, ".log"
+
+def get_log_compression(log):
+    """
+    (compression, suffix) of a log file (see log_compression)
+    """
+    fp = open_raw_log(log)
+    try:
+        return log_compression(fp)
+    finally:
+        if log != "-":
+            fp.close()
+
+def decompress(fp, compression):
+    """
+    a binary file giving the decompressed contents of fp
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fp, mode="rb")
+    if compression == "xz":
+        return lzma.LZMAFile(fp)
+    if compression == "zstd":
+        if zstandard is None:
+            raise parse_error("zstandard module is required to read a zstd-compressed log %s"
+                              % getattr(fp, "name", ""))
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fp))
+    return fp
+
+class tee_reader:
+    """
+    a binary file reading fp and writing whatever it read to copy
+    """
+    def __init__(self, fp, copy):
+        self.fp = fp
+        self.name = fp.name
+        self.copy = copy
+    def read(self, size=-1):
+        """
+        read up to size bytes
+        """
+        data = self.fp.read(size)
+        self.copy.write(data)
+        return data
+    def readline(self):
+        """
+        read a line
+        """
+        data = self.fp.readline()
+        self.copy.write(data)
+        return data
+    def seek(self, offset, whence=0):
+        """
+        seek (to skip what has been copied before)
+        """
+        return self.fp.seek(offset, whence)
+    def drain(self):
+        """
+        copy the rest of fp
+        """
+        while self.read(1 << 20) != b"":
+            pass
+
+def stream_log(log, follow=False, resume=None, copy=None):
+    """
+    parse a log, generating events (see log_parser.events)
+    without keeping the whole log in memory.
+    a log compressed with gzip, xz or zstd is decompressed as it is parsed.
+    with follow, the log is still being written (see log_reader).
+    with resume (a checkpoint event of a previous parse of
+    the same log), start from there.
+    with copy (a file opened in binary mode), the log is copied
+    into it as it is (i.e., still compressed if it is).  when
+    resuming, copy must have been truncated to the copy_offset
+    of the checkpoint event
+    """
+    fp = open_raw_log(log)
+    try:
+        compression, _ = log_compression(fp)
+        if follow and compression is not None:
+            raise parse_error("cannot follow a compressed log %s" % log)
+        raw = fp if copy is None else tee_reader(fp, copy)
+        # a compressed log is decompressed from the beginning up to offset
+        offset = 0 if resume is None else resume["offset"]
+        psr = log_parser(log_reader(decompress(raw, compression), offset, follow,
+                                    skip=compression is not None))
+        if resume is not None:
+            psr.restore_checkpoint(resume)
+        for kind, data in psr.events(resume):
+            if kind == "checkpoint":
+                data["copy_offset"] = data["offset"] if compression is None else 0
+            yield kind, data
+        if copy is not None:
+            raw.drain()
+    finally:
+        if log != "-":
+            fp.close()
+
+def find_epoch_offsets(log):
+    """
+    byte offsets of "NNN: Train Epoch N starts" lines in log
+    """
+    pat = re.compile(rb"^\d+: Train Epoch \d+ starts", re.MULTILINE)
+    with open(log, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size == 0:
+            return [], size
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return [m.start() for m in pat.finditer(buf)], size
+
+def parse_chunk(args):
+    """
+    parse bytes [start,end) of log in a worker process
+    and return the parser state (log_parser.get_state)
+    """
+    log, start, end, first, last = args
+    with open(log, "rb") as fp:
+        fp.seek(start)
+        buf = io.BytesIO(fp.read(end - start))
+    buf.name = "%s@%d" % (log, start)
+    psr = log_parser(io.TextIOWrapper(buf))
+    psr.parse_chunk(first, last)
+    return psr.get_state()
+
+def parse_log_parallel(log, jobs):
+    """
+    parse a log with jobs processes.  the log is cut into
+    chunks of whole epochs, parsed in parallel and merged.
+    returns the same thing as parse_log(log)
+    """
+    offsets, size = find_epoch_offsets(log)
+    # a few chunks per process to balance the load
+    n_chunks = max(1, min(len(offsets), jobs * 4))
+    cuts = [0] + [offsets[(i * len(offsets)) // n_chunks] for i in range(1, n_chunks)] + [size]
+    chunks = [(log, a, b, a == 0, b == size) for a, b in zip(cuts, cuts[1:])]
+    with multiprocessing.Pool(jobs) as pool:
+        states = pool.map(parse_chunk, chunks, chunksize=1)
+    psr = log_parser(io.StringIO(""))
+    for state in states:
+        psr.merge_state(state)
+    with open(log) as fp:
+        all_data = fp.read()
+    return ({"key_vals"      : psr.get_key_vals(),
+             "samples"       : psr.get_samples(),
+             "loss_accuracy" : psr.get_loss_accuracy(),
+             "kernel_times"  : psr.get_kernel_times(),
+             "meta"          : get_meta()
+             },
+            all_data)
+
+class profiler:
+    """
+    wall time spent in stages of processing logs.
+    instrument replaces a function or method with one that adds
+    its time to a stage, excluding the time of other instrumented
+    functions it calls, so the stages add up to the total
+    """
+    def __init__(self):
+        self.stages = {}
+        self.stack = []
+        self.t0 = time.perf_counter()
+    def instrument(self, obj, name, stage):
+        """
+        time calls to function/method NAME of OBJ (a module
+        or a class) as STAGE
+        """
+        fun = getattr(obj, name)
+        prof = self
+        def timed(*args, **kwargs):
+            prof.stack.append([time.perf_counter(), 0.0])
+            try:
+                return fun(*args, **kwargs)
+            finally:
+                prof.leave(stage)
+        timed.__doc__ = fun.__doc__
+        setattr(obj, name, timed)
+    def leave(self, stage):
+        """
+        a call of stage returned
+        """
+        t0, t_children = self.stack.pop()
+        dt = time.perf_counter() - t0
+        calls_time = self.stages.setdefault(stage, [0, 0.0])
+        calls_time[0] += 1
+        calls_time[1] += dt - t_children
+        if len(self.stack) > 0:
+            self.stack[-1][1] += dt
+    def report(self, wp):
+        """
+        write time, calls and calls/sec of each stage to wp
+        """
+        total = time.perf_counter() - self.t0
+        rest = total - sum(t for _, t in self.stages.values())
+        wp.write("%-20s %10s %6s %12s %12s\n" % ("stage", "sec", "%", "calls", "calls/sec"))
+        for stage, (calls, t) in sorted(self.stages.items(), key=lambda x: -x[1][1]):
+            wp.write("%-20s %10.3f %6.1f %12d %12.0f\n"
+                     % (stage, t, 100.0 * t / total, calls, calls / t if t > 0 else 0))
+        wp.write("%-20s %10.3f %6.1f\n" % ("(other)", rest, 100.0 * rest / total))
+        wp.write("%-20s %10.3f\n" % ("total", total))
+
+def instrument(prof):
+    """
+    time stages of parsing a log with profiler prof
+    """
+    prof.instrument(log_reader, "readline", "read")
+    prof.instrument(log_parser_base, "tokenize", "tokenize")
+    prof.instrument(kernel_cache, "lookup", "kernel signatures")
+    prof.instrument(log_parser, "drain_events", "drain events")
+
+def parse_log(log, jobs=1):
+    """
+    parse a log.  with jobs > 1, parse it in parallel
+    (see parse_log_parallel)
+    """
+    raw = open_raw_log(log)
+    compression, _ = log_compression(raw)
+    if jobs > 1 and log != "-" and compression is None:
+        raw.close()
+        return parse_log_parallel(log, jobs)
+    fp = io.TextIOWrapper(decompress(raw, compression))
     psr = log_parser(fp)
     psr.parse_file()
     key_vals = psr.get_key_vals()
@@ -695,11 +1339,11 @@ def parse_log(log):
     loss_accuracy = psr.get_loss_accuracy()
     kernel_times = psr.get_kernel_times()
     all_data = psr.get_all_data()
-    classes = ["airplane", "automobile", "bird", "cat",
-               "deer", "dog", "frog", "horse", "ship", "truck"]
-    meta = [{"class": x} for x in classes]
+    meta = get_meta()
     if log != "-":
         fp.close()
+    else:
+        fp.detach()
     return ({"key_vals"      : key_vals,
              "samples"       : samples,
              "loss_accuracy" : loss_accuracy,
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+"""
+stress_submit --- submit many logs at once to a local database
+
+generate synthetic logs (see gen_log.py), each having a variable
+run=I, and run as many submit.py processes at the same time, each
+submitting one of them into the same database, while another
+process keeps reading the database as a viewer would.  then check
+ - all submissions succeeded and the reader never failed
+ - each run is in the database exactly once, with a seqid of its own
+ - each run has all its samples and kernel calls, also seen
+   through the kernel_times view (in run files with --partition)
+ - each raw log has been moved to the store
+with --enqueue, submissions only queue the logs and ingestd.py
+inserts them afterwards.  with --partition, the database is
+partitioned (submit --partition) before submissions
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import gen_log
+import submit
+
+reader_code = r"""
+import sqlite3, sys, time
+con = sqlite3.connect(sys.argv[1], timeout=60.0)
+n = 0
+while 1:
+    for tbl in ["info", "samples", "kernel_calls"]:
+        try:
+            con.execute("select count(*) from %s" % tbl).fetchall()
+        except sqlite3.OperationalError as err:
+            if "no such table" not in str(err):
+                raise
+    n += 1
+    sys.stdout.write("%d\n" % n)
+    sys.stdout.flush()
+    time.sleep(0.01)
+"""
+
+def gen_logs(log_dir, n, n_lines):
+    """
+    generate n logs of n_lines lines, having run=0 .. run=n-1.
+    return their paths and (samples, kernel calls) of each
+    """
+    logs = []
+    for i in range(n):
+        log = os.path.join(log_dir, "run%03d.log" % i)
+        with open(log, "w") as wp:
+            wp.writelines(gen_log.gen_log("mnist", n_lines=n_lines, env={"run" : i}))
+        logs.append(log)
+    n_samples = n_kernels = 0
+    with open(logs[0]) as fp:
+        for line in fp:
+            if ": sample " in line:
+                n_samples += 1
+            elif ": ends. took " in line:
+                n_kernels += 1
+    return logs, (n_samples, n_kernels)
+
+def submit_all(submit_py, data_dir, logs, extra_args):
+    """
+    run submit.py of each log at the same time.
+    return [(log, exit status, stderr)] and elapsed seconds
+    """
+    t0 = time.time()
+    procs = []
+    for log in logs:
+        cmd = [sys.executable, submit_py, "--data", data_dir] + extra_args + [log]
+        procs.append((log, subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.PIPE, text=True)))
+    results = []
+    for log, proc in procs:
+        _, err = proc.communicate()
+        results.append((log, proc.returncode, err))
+    return results, time.time() - t0
+
+def check(data_dir, logs, expected):
+    """
+    check the database and files after submitting logs.
+    return a list of problems found
+    """
+    problems = []
+    con = sqlite3.connect(os.path.join(data_dir, "a.sqlite"))
+    rows = con.execute("select seqid, run from info_all").fetchall()
+    runs = {}
+    for seqid, run in rows:
+        runs.setdefault(int(run), []).append(seqid)
+    for i in range(len(logs)):
+        if len(runs.get(i, [])) != 1:
+            problems.append("run %d is in the database %d times" % (i, len(runs.get(i, []))))
+    seqids = [seqid for seqid, _ in rows]
+    if len(set(seqids)) != len(seqids):
+        problems.append("seqids are not unique: %s" % sorted(seqids))
+    [(counter,)] = con.execute("select x from seq_counter").fetchall()
+    if counter != len(logs):
+        problems.append("seq_counter is %d after %d submissions" % (counter, len(logs)))
+    n_samples, n_kernels = expected
+    schema = submit.read_schema(con)
+    for tbl, n in [("samples", n_samples), ("kernel_calls", n_kernels),
+                   ("kernel_times", n_kernels)]:
+        counts = {row[0] : row[1] for row in
+                  submit.run_rows(con, schema, seqids, "select seqid, count(*)"
+                                  " from %s where seqid = ?" % tbl)}
+        for seqid in seqids:
+            if counts.get(seqid, 0) != n:
+                problems.append("seqid %d has %d %s rows (expected %d)"
+                                % (seqid, counts.get(seqid, 0), tbl, n))
+    con.close()
+    stored = sum(len(files) for _, _, files in os.walk(os.path.join(data_dir, "store")))
+    queued = len(os.listdir(os.path.join(data_dir, "queue")))
+    for sub, count, n in [("store", stored, len(logs)), ("queue", queued, 0)]:
+        if count != n:
+            problems.append("%d files in %s/ (expected %d)" % (count, sub, n))
+    return problems
+
+def parse_args(argv):
+    """
+    parse command line args
+    """
+    psr = argparse.ArgumentParser()
+    psr.add_argument("--submitters", "-n", type=int, default=32,
+                     help="number of submissions at the same time")
+    psr.add_argument("--lines", "-l", type=int, default=20000,
+                     help="number of lines of each log")
+    psr.add_argument("--data", metavar="DIRECTORY",
+                     help="database directory (default: a temporary directory removed afterwards)")
+    psr.add_argument("--checkpoint", "-c", metavar="SECONDS", type=float,
+                     help="submit with --checkpoint SECONDS")
+    psr.add_argument("--busy-timeout", metavar="SECONDS", type=float,
+                     help="submit with --busy-timeout SECONDS")
+    psr.add_argument("--enqueue", "-q", action="store_true",
+                     help="submit with --enqueue and then run ingestd.py --once")
+    psr.add_argument("--partition", action="store_true",
+                     help="partition the database (submit --partition) first")
+    return psr.parse_args(argv)
+
+def main():
+    """
+    main
+    """
+    args = parse_args(sys.argv[1:])
+    this_dir = os.path.dirname(os.path.abspath(__file__))
+    submit_py = os.path.join(this_dir, "submit.py")
+    work_dir = tempfile.mkdtemp(prefix="stress")
+    data_dir = args.data if args.data else os.path.join(work_dir, "records")
+    extra_args = []
+    if args.checkpoint is not None:
+        extra_args += ["--checkpoint", str(args.checkpoint)]
+    if args.busy_timeout is not None:
+        extra_args += ["--busy-timeout", str(args.busy_timeout)]
+    if args.enqueue:
+        extra_args += ["--enqueue"]
+    try:
+        logs, expected = gen_logs(work_dir, args.submitters, args.lines)
+        os.makedirs(data_dir, exist_ok=True)
+        if args.partition:
+            subprocess.run([sys.executable, submit_py, "--data", data_dir, "--partition"],
+                           stderr=subprocess.DEVNULL, check=True)
+        reader = subprocess.Popen([sys.executable, "-c", reader_code,
+                                   os.path.join(data_dir, "a.sqlite")],
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        results, dt = submit_all(submit_py, data_dir, logs, extra_args)
+        dt_ingest = None
+        if args.enqueue:
+            t0 = time.time()
+            subprocess.run([sys.executable, os.path.join(this_dir, "ingestd.py"),
+                            "--data", data_dir, "--once"],
+                           stderr=subprocess.DEVNULL, check=True)
+            dt_ingest = time.time() - t0
+        reader.kill()
+        reads, reader_err = reader.communicate()
+        problems = ["%s: exit status %d\n%s" % (log, status, err)
+                    for log, status, err in results if status != 0]
+        if "Traceback" in reader_err:
+            problems.append("reader failed\n%s" % reader_err)
+        problems.extend(check(data_dir, logs, expected))
+    finally:
+        shutil.rmtree(work_dir)
+    print("%d submissions of %d lines in %.1f sec (%.1f submissions/sec),"
+          " %d reads meanwhile"
+          % (len(logs), args.lines, dt, len(logs) / dt, len(reads.split())))
+    if dt_ingest is not None:
+        print("ingestd inserted them in %.1f sec" % dt_ingest)
+    for problem in problems:
+        print("NG: %s" % problem)
+    if len(problems) == 0:
+        print("OK")
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
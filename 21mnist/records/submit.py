@@ -5,11 +5,19 @@ submit execution log
 """
 
 import argparse
+import collections
+import cProfile
 import errno
-#import json
+import gzip
+import hashlib
+import json
+import multiprocessing
 import os
+import pickle
 import pwd
+import random
 import re
+import shutil
 import sqlite3
 import sys
 import tempfile
@@ -21,6 +29,12 @@ default_data_dir = "/home/share/public_html/parallel-distributed/21mnist/records
 
 dbg = 0
 
+# seconds to wait for other submissions holding the database
+# before giving up with "database is locked", and how many times
+# to retry (with an exponential backoff) after giving up
+busy_timeout = 60.0
+busy_retries = 5
+
 # --------- nuts and bolts ---------
 
 def Ws(msg):
@@ -57,6 +71,14 @@ def do_sql(con, cmd, dbg_level, *vals):
         Es("%s with %s\n" % (cmd, vals))
     return con.execute(cmd, vals)
 
+def do_sql_many(con, cmd, dbg_level, rows):
+    """
+    do sql statement for each of rows (lists of values)
+    """
+    if dbg_level <= dbg:
+        Es("%s with %d rows\n" % (cmd, len(rows)))
+    return con.executemany(cmd, rows)
+
 def read_schema(con):
     """
     read schema of all tables
@@ -79,34 +101,713 @@ def ensure_columns(con, schema, tbl, columns):
         create_cmd = "create table if not exists {}({})".format(tbl, ",".join(columns))
         do_sql(con, create_cmd, 1)
         schema[tbl] = columns
+        ensure_indexes(con, schema, [tbl])
     else:
         existing_columns = schema[tbl]
+        n_existing_columns = len(existing_columns)
+        # compare names, as columns may be given with types ("x integer")
+        existing_names = {col.split()[0] for col in existing_columns}
         for col in columns:
-            if col not in existing_columns:
+            if col.split()[0] not in existing_names:
                 alt_cmd = "alter table {} add {}".format(tbl, col)
                 do_sql(con, alt_cmd, 1)
                 existing_columns.append(col)
+                existing_names.add(col.split()[0])
         schema[tbl] = existing_columns
+        if len(existing_columns) > n_existing_columns:
+            ensure_indexes(con, schema, [tbl])
+
+# indexes tables have besides one on seqid, which every table
+# having seqid gets unless one of these begins with seqid
+indexes = {
+    # delete_from_db, --delete-mine and the viewer's "where owner = ..."
+    # and other promoted variables
+    "info" : [["owner"], ["start_at"], ["host"], ["algo_s"], ["batch_size"]],
+    # info_all looks up a variable of a run
+    "env" : [["seqid", "key", "val"]],
+    # covers the kernel breakdown of the viewer, which sums
+    # dt_per_sample_sum and n where seqid in (...) group by seqid,kernel_id
+    "kernel_stats" : [["seqid", "kernel_id", "dt_per_sample_sum", "n"]],
+    "checkpoints" : [["ident"]],
+    "ingested" : [["log"]],
+    "log_hashes" : [["hash"]],
+    # what viewers sort runs by
+    "run_summary" : [["samples_per_sec"], ["elapsed"], ["best_test_accuracy"]],
+}
+
+def table_indexes(tbl, columns):
+    """
+    list of columns of each index table TBL having COLUMNS should have
+    """
+    names = [col.split()[0] for col in columns]
+    idxs = [idx for idx in indexes.get(tbl, []) if all(col in names for col in idx)]
+    if "seqid" in names and all(idx[0] != "seqid" for idx in idxs):
+        idxs.insert(0, ["seqid"])
+    return idxs
+
+def ensure_indexes(con, schema, tbls=None):
+    """
+    ensure tables TBLS (default: all tables) have indexes
+    (see table_indexes).  a run file (see run_db) has rows of
+    a single seqid, which no index helps finding
+    """
+    if "run" in schema:
+        return
+    for tbl in (tbls if tbls is not None else list(schema)):
+        for idx in table_indexes(tbl, schema[tbl]):
+            do_sql(con, "create index if not exists {}_{} on {}({})"
+                   .format(tbl, "_".join(idx), tbl, ",".join(idx)), 1)
+
+def retry_busy(con, cmd, script=False):
+    """
+    do sql statement cmd (statements if script) that waits for
+    the database lock, retrying a few times when it still fails
+    after busy_timeout
+    """
+    for i in range(busy_retries + 1):
+        try:
+            if script:
+                return con.executescript(cmd)
+            return do_sql(con, cmd, 1)
+        except sqlite3.OperationalError as err:
+            if script and con.in_transaction:
+                con.rollback()
+            if i == busy_retries or "locked" not in str(err) and "busy" not in str(err):
+                raise
+            delay = random.uniform(0.5, 1.5) * 2 ** i
+            Es("submit.py: {}, retrying in {:.1f} sec\n".format(err, delay))
+            time.sleep(delay)
+    assert(0), cmd
+
+def begin_transaction(con, schema):
+    """
+    begin a transaction, taking the write lock of the database
+    right away so that it does not fail in the middle.
+    other submissions may have changed the schema while we did
+    not hold the lock, so read it again
+    """
+    retry_busy(con, "begin immediate")
+    schema.clear()
+    schema.update(read_schema(con))
 
 def open_for_transaction(sqlite3_file):
     """
-    open database for transaction
+    open database for transaction.
+    the database is in WAL mode so that readers (viewers) and
+    a writer do not block each other and a transaction is begun
+    (see begin_transaction)
     """
-    con = sqlite3.connect(sqlite3_file)
+    con = sqlite3.connect(sqlite3_file, timeout=busy_timeout)
     con.row_factory = sqlite3.Row
-    schema = read_schema(con)
+    # takes effect only when the database is created (see vacuum_db)
+    do_sql(con, "pragma auto_vacuum = incremental", 1)
+    retry_busy(con, "pragma journal_mode = wal")
+    schema = {}
+    begin_transaction(con, schema)
     if "seq_counter" not in schema:
         do_sql(con, "create table seq_counter(x)", 1)
         do_sql(con, "insert into seq_counter(x) values(?)", 1, 0)
-    schema = read_schema(con)
+        schema.update(read_schema(con))
+    ensure_info_tables(con, schema)
+    ensure_kernel_tables(con, schema)
+    ensure_kernel_stats(con, schema)
+    ensure_run_summary(con, schema)
+    ensure_confusion(con, schema)
+    ensure_indexes(con, schema)
     return con, schema
 
+# kernel invocations are stored in kernel_calls, referring to
+# a row of kernels (class, function and their template args)
+# by kernel_id.  kernel_times is a view joining the two, having
+# the columns kernel_times table used to have
+kernel_calls_columns = ["seqid", "t0", "t1", "kernel_id", "dt", "train_test", "a", "b"]
+kernels_columns = ["kernel_id integer primary key", "cls", "cargs", "fun", "fargs"]
+kernel_times_view = """create view kernel_times as
+select c.seqid, c.t0, c.t1, k.cls, k.cargs, k.fun, k.fargs, c.dt, c.train_test, c.a, c.b
+from kernel_calls c join kernels k on c.kernel_id = k.kernel_id"""
+
+def ensure_kernel_tables(con, schema):
+    """
+    ensure kernels and kernel_calls tables and kernel_times view exist.
+    a kernel_times table of an old database is converted into them
+    """
+    ensure_columns(con, schema, "kernels", kernels_columns)
+    ensure_columns(con, schema, "kernel_calls", kernel_calls_columns)
+    if "kernel_times" in schema:
+        kernel_ids = {}
+        for row in do_sql(con, "select distinct cls, cargs, fun, fargs from kernel_times", 1):
+            get_kernel_id(con, schema, kernel_ids, dict(row))
+        do_sql(con, """insert into kernel_calls({})
+        select t.seqid, t.t0, t.t1, k.kernel_id, t.dt, t.train_test, t.a, t.b
+        from kernel_times t join kernels k
+        on t.cls is k.cls and t.cargs is k.cargs and t.fun is k.fun and t.fargs is k.fargs
+        order by t.rowid""".format(",".join(kernel_calls_columns)), 1)
+        do_sql(con, "drop table kernel_times", 1)
+        del schema["kernel_times"]
+    views = {row["name"] for row in
+             do_sql(con, 'select name from sqlite_master where type = "view"', 1)}
+    if "kernel_times" not in views:
+        do_sql(con, kernel_times_view, 1)
+
+def parse_template_args(args):
+    """
+    "<64,1,28>" --> [64, 1, 28]
+    """
+    if args is None:
+        return []
+    return [parse_val(x) for x in args[1:-1].split(",")]
+
+def get_kernel_id(con, schema, kernel_ids, row):
+    """
+    kernel_id of the kernel (cls, cargs, fun, fargs) of ROW,
+    inserting it into kernels if it is not there yet.
+    its template args are also stored as numbers in columns
+    carg0, carg1, ... and farg0, farg1, ...
+    KERNEL_IDS caches kernel_ids already looked up
+    """
+    key = (row["cls"], row["cargs"], row["fun"], row["fargs"])
+    kernel_id = kernel_ids.get(key)
+    if kernel_id is not None:
+        return kernel_id
+    found = list(do_sql(con, ("select kernel_id from kernels where"
+                              " cls is ? and cargs is ? and fun is ? and fargs is ?"), 1, *key))
+    if len(found) > 0:
+        kernel_id = found[0]["kernel_id"]
+    else:
+        kernel = dict(cls=row["cls"], cargs=row["cargs"], fun=row["fun"], fargs=row["fargs"])
+        for prefix, args in [("carg", row["cargs"]), ("farg", row["fargs"])]:
+            for i, x in enumerate(parse_template_args(args)):
+                kernel["%s%d" % (prefix, i)] = x
+        fields = list(kernel.keys())
+        ensure_columns(con, schema, "kernels", fields)
+        ins_cmd = ("insert into kernels({}) values({})"
+                   .format(",".join(fields), ",".join(["?"] * len(fields))))
+        kernel_id = do_sql(con, ins_cmd, 2, *[kernel[f] for f in fields]).lastrowid
+    kernel_ids[key] = kernel_id
+    return kernel_id
+
+def make_kernel_call(con, schema, kernel_ids, row):
+    """
+    a kernel_calls row of a kernel_times row (a kernel event of parse_log)
+    """
+    row = dict(row)
+    row["kernel_id"] = get_kernel_id(con, schema, kernel_ids, row)
+    for col in ["cls", "cargs", "fun", "fargs"]:
+        del row[col]
+    return row
+
+class running_stat:
+    """
+    count, sum, min, max, mean, variance and a histogram
+    of values added one by one.  bucket i of the histogram
+    counts values x with 2^(i-1) <= x < 2^i (bucket 0 x < 1)
+    """
+    def __init__(self):
+        self.n = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.hist = []
+    def add(self, x):
+        """
+        add a value
+        """
+        self.n += 1
+        self.sum += x
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        bucket = int(x).bit_length() if x >= 1 else 0
+        if bucket >= len(self.hist):
+            self.hist.extend([0] * (bucket + 1 - len(self.hist)))
+        self.hist[bucket] += 1
+    def to_row(self, prefix):
+        """
+        columns of kernel_stats (PREFIX_sum etc.)
+        """
+        var = self.m2 / self.n if self.n > 0 else None
+        return {prefix + "_sum" : self.sum, prefix + "_min" : self.min,
+                prefix + "_max" : self.max, prefix + "_mean" : self.mean,
+                prefix + "_var" : var, prefix + "_hist" : json.dumps(self.hist)}
+    def from_row(self, n, row, prefix):
+        """
+        restore what to_row(prefix) saved
+        """
+        self.n = n
+        self.sum = row[prefix + "_sum"]
+        self.min = row[prefix + "_min"]
+        self.max = row[prefix + "_max"]
+        self.mean = row[prefix + "_mean"]
+        self.m2 = (row[prefix + "_var"] or 0.0) * n
+        self.hist = json.loads(row[prefix + "_hist"])
+        return self
+
+class kernel_stat:
+    """
+    statistics of execution times of a kernel in a phase (train/test)
+    of a run: dt and dt per sample (dt / (b - a))
+    """
+    def __init__(self):
+        self.n = 0
+        self.samples = 0
+        self.dt = running_stat()
+        self.dt_per_sample = running_stat()
+    def add(self, row):
+        """
+        add a kernel_calls row
+        """
+        dt = row["dt"]
+        n_samples = row["b"] - row["a"]
+        if dt < 0 or n_samples <= 0:
+            # the kernel did not end
+            return
+        self.n += 1
+        self.samples += n_samples
+        self.dt.add(dt)
+        self.dt_per_sample.add(dt / n_samples)
+    def to_row(self):
+        """
+        columns of kernel_stats other than seqid, kernel_id and train_test
+        """
+        row = dict(n=self.n, samples=self.samples)
+        row.update(self.dt.to_row("dt"))
+        row.update(self.dt_per_sample.to_row("dt_per_sample"))
+        return row
+    def from_row(self, row):
+        """
+        restore what to_row saved
+        """
+        self.n = row["n"]
+        self.samples = row["samples"]
+        self.dt.from_row(self.n, row, "dt")
+        self.dt_per_sample.from_row(self.n, row, "dt_per_sample")
+        return self
+
+def add_kernel_stat(stats, row):
+    """
+    add a kernel_calls row to STATS, a dictionary
+    (kernel_id, train_test) -> kernel_stat
+    """
+    key = (row["kernel_id"], row["train_test"])
+    if key not in stats:
+        stats[key] = kernel_stat()
+    stats[key].add(row)
+
+def save_kernel_stats(con, schema, stats, seqid):
+    """
+    replace kernel_stats rows of seqid with STATS
+    """
+    if "kernel_stats" in schema:
+        do_sql(con, "delete from kernel_stats where seqid = ?", 1, seqid)
+    rows = []
+    for (kernel_id, train_test), stat in sorted(stats.items()):
+        row = dict(kernel_id=kernel_id, train_test=train_test)
+        row.update(stat.to_row())
+        rows.append(row)
+    insert_rows(con, schema, "kernel_stats", rows, seqid)
+
+def load_kernel_stats(con, schema, seqid):
+    """
+    kernel_stats rows of seqid saved by save_kernel_stats
+    """
+    stats = {}
+    if "kernel_stats" in schema:
+        for row in do_sql(con, "select * from kernel_stats where seqid = ?", 1, seqid):
+            stats[row["kernel_id"], row["train_test"]] = kernel_stat().from_row(row)
+    return stats
+
+def ensure_kernel_stats(con, schema):
+    """
+    compute kernel_stats of runs inserted before it was introduced
+    """
+    if "kernel_stats" in schema:
+        return
+    stats = {}
+    for row in do_sql(con, "select * from kernel_calls order by seqid", 1):
+        add_kernel_stat(stats.setdefault(row["seqid"], {}), row)
+    for seqid, run_stats in stats.items():
+        save_kernel_stats(con, schema, run_stats, seqid)
+
+# run_summary has a row of numbers per run, computed from info,
+# loss_accuracy and kernel_stats when the run is inserted, so that
+# viewers can sort and filter runs by them without computing them
+# in each query.  times are in seconds since the epoch.  samples is
+# train_data_size * epochs, as the viewer used to compute it, and
+# trained_samples those trained until the run ended (max samples of
+# loss_accuracy), fewer than samples if the run ended early
+run_summary_columns = ["seqid", "start_t integer", "end_t integer", "elapsed integer",
+                       "samples", "samples_per_sec", "trained_samples",
+                       "final_test_accuracy", "final_test_loss",
+                       "best_test_accuracy", "best_test_loss", "kernel_dt"]
+
+def parse_time(st):
+    """
+    "2026-10-17T04-12-07" (start_at/end_at of info) --> seconds since
+    the epoch, or None if it is not such a string
+    """
+    try:
+        return int(time.mktime(time.strptime(st, "%Y-%m-%dT%H-%M-%S")))
+    except (TypeError, ValueError):
+        return None
+
+def save_run_summary(con, schema, seqid):
+    """
+    replace the run_summary row of seqid with one computed from
+    its rows of info, loss_accuracy and kernel_stats
+    """
+    row = dict.fromkeys(col.split()[0] for col in run_summary_columns[1:])
+    if "info" in schema:
+        # end_at may not be a column yet, if no run has finished
+        for info in do_sql(con, """select *, train_data_size * epochs as samples
+        from info where seqid = ?""", 1, seqid):
+            info = dict(info)
+            row["start_t"] = parse_time(info.get("start_at"))
+            row["end_t"] = parse_time(info.get("end_at"))
+            row["samples"] = info["samples"]
+    if row["start_t"] is not None and row["end_t"] is not None:
+        row["elapsed"] = row["end_t"] - row["start_t"]
+    rcon, rschema = run_db(con, schema, seqid)
+    if "loss_accuracy" in rschema:
+        [loss] = do_sql(rcon, """select max(samples) as trained_samples,
+        max(case when test_accuracy != '' then test_accuracy end) as best_test_accuracy,
+        min(case when test_loss != '' then test_loss end) as best_test_loss
+        from loss_accuracy where seqid = ?""", 1, seqid)
+        row.update(dict(loss))
+        for final in do_sql(rcon, """select test_accuracy, test_loss
+        from loss_accuracy where seqid = ? and test_accuracy != ''
+        order by samples desc, t desc limit 1""", 1, seqid):
+            row["final_test_accuracy"] = final["test_accuracy"]
+            row["final_test_loss"] = final["test_loss"]
+    if row["samples"] is not None and row["elapsed"]:
+        row["samples_per_sec"] = row["samples"] / row["elapsed"]
+    if "kernel_stats" in schema:
+        [(row["kernel_dt"],)] = do_sql(con, "select sum(dt_sum) from kernel_stats"
+                                       " where seqid = ?", 1, seqid)
+    ensure_columns(con, schema, "run_summary", run_summary_columns)
+    do_sql(con, "delete from run_summary where seqid = ?", 1, seqid)
+    insert_row(con, schema, "run_summary", row, seqid)
+
+def ensure_run_summary(con, schema):
+    """
+    compute run_summary of runs inserted before it was introduced
+    """
+    if "run_summary" in schema or "info" not in schema:
+        return
+    ensure_columns(con, schema, "run_summary", run_summary_columns)
+    for (seqid,) in list(do_sql(con, "select seqid from info", 1)):
+        save_run_summary(con, schema, seqid)
+
+# confusion has the number of samples of each (pred, truth) pair
+# of each run, so that runs whose samples have been compacted
+# away (see compact_runs) still tell which digits they got wrong
+confusion_columns = ["seqid", "train_test", "pred", "truth", "n integer"]
+
+def save_confusion(con, schema, seqid):
+    """
+    replace confusion rows of seqid with counts of its samples
+    """
+    ensure_columns(con, schema, "confusion", confusion_columns)
+    do_sql(con, "delete from confusion where seqid = ?", 1, seqid)
+    rcon, rschema = run_db(con, schema, seqid)
+    if "samples" in rschema:
+        rows = [dict(row) for row in do_sql(rcon, """select train_test, pred, truth,
+        count(*) as n from samples where seqid = ? group by train_test, pred, truth""",
+                                             1, seqid)]
+        insert_rows(con, schema, "confusion", rows, seqid)
+
+def ensure_confusion(con, schema):
+    """
+    compute confusion of runs inserted before it was introduced
+    """
+    if "confusion" in schema or "info" not in schema:
+        return
+    ensure_columns(con, schema, "confusion", confusion_columns)
+    for (seqid,) in list(do_sql(con, "select seqid from info", 1)):
+        save_confusion(con, schema, seqid)
+
+# compact_runs deletes raw rows of these tables, of which other
+# tables keep aggregates (kernel_calls in kernel_stats, samples in
+# confusion), and records how many in compacted.  --reingest
+# brings them back from the stored log
+compacted_tables = ["kernel_calls", "samples"]
+compacted_columns = ["seqid", "compacted_t integer", "kernel_calls integer", "samples integer"]
+
+def runs_to_compact(con, schema, before, keep):
+    """
+    seqids of finished runs, not compacted yet, that started before
+    BEFORE (seconds since the epoch) or are not among the KEEP most
+    recent runs of their owner (None to not select by either)
+    """
+    conds = []
+    vals = []
+    if before is not None:
+        conds.append("start_t < ?")
+        vals.append(before)
+    if keep is not None:
+        conds.append("recent > ?")
+        vals.append(keep)
+    if len(conds) == 0 or "info" not in schema:
+        return []
+    compacted = "and seqid not in (select seqid from compacted)" if "compacted" in schema else ""
+    cmd = """select seqid from
+    (select i.seqid, i.finished, s.start_t,
+            row_number() over (partition by i.owner
+                               order by s.start_t desc, i.seqid desc) as recent
+     from info i left join run_summary s using (seqid))
+    where ifnull(finished, 1) != 0 and ({}) {} order by seqid""".format(
+        " or ".join(conds), compacted)
+    return [seqid for (seqid,) in do_sql(con, cmd, 1, *vals)]
+
+def compact_runs(con, schema, seqids):
+    """
+    delete rows of compacted_tables of SEQIDS, leaving their
+    aggregates.  return the number of rows deleted from each table
+    """
+    do_sql(con, "pragma secure_delete = off", 1)
+    total = dict.fromkeys(compacted_tables, 0)
+    for seqid in seqids:
+        row = {"compacted_t" : int(time.time())}
+        rcon, rschema = run_db(con, schema, seqid)
+        for tbl in compacted_tables:
+            if tbl in rschema:
+                row[tbl] = do_sql(rcon, "delete from %s where seqid = ?" % tbl,
+                                  1, seqid).rowcount
+                total[tbl] += row[tbl]
+        ensure_columns(con, schema, "compacted", compacted_columns)
+        insert_row(con, schema, "compacted", row, seqid)
+    return total
+
+def commit(con):
+    """
+    commit the transaction, after those of run files written
+    in it (see run_db), so that the catalog never refers to rows
+    of a run file that are not there, and then remove run files
+    of runs deleted in it (see drop_run_files), so that it never
+    refers to a run file that is not there
+    """
+    for rcon, _ in run_dbs.values():
+        rcon.commit()
+        rcon.close()
+    run_dbs.clear()
+    con.commit()
+    for path in dropped_run_files:
+        remove_run_file(path)
+    dropped_run_files.clear()
+
+def rollback(con):
+    """
+    roll back the transaction and those of run files written in
+    it, keeping run files of runs deleted in it
+    """
+    for rcon, _ in run_dbs.values():
+        rcon.rollback()
+        rcon.close()
+    run_dbs.clear()
+    dropped_run_files.clear()
+    con.rollback()
+
+# with --partition, bulk rows of each run (tables of event_tables)
+# are in a file of its own (a run file, runs/SEQID.sqlite next to
+# a.sqlite), listed in partitions of a.sqlite (the catalog), which
+# keeps info, summaries and other small tables.  reading a run opens
+# its file only, and deleting a run unlinks its file.  runs inserted
+# before --partition keep their rows in the catalog until then
+partitions_columns = ["seqid integer", "file text"]
+# run files being written in this process (seqid -> (connection,
+# schema)), committed and closed by commit
+run_dbs = {}
+# run files of runs deleted in the transaction (paths), removed
+# by commit once it is committed
+dropped_run_files = []
+
+def run_file(seqid, n=0):
+    """
+    run file of SEQID, relative to the catalog (the N-th name,
+    when the first ones are taken)
+    """
+    if n == 0:
+        return os.path.join("runs", "{:06d}.sqlite".format(seqid))
+    return os.path.join("runs", "{:06d}-{}.sqlite".format(seqid, n))
+
+def catalog_dir(con):
+    """
+    directory of the catalog opened as CON
+    """
+    for row in do_sql(con, "pragma database_list", 1):
+        if row[1] == "main":
+            return os.path.dirname(row[2])
+    assert(0), "no main database"
+
+def remove_run_file(path):
+    """
+    remove a run file, along with its journal or WAL
+    """
+    for f in [path, path + "-journal", path + "-wal", path + "-shm"]:
+        if os.path.exists(f):
+            os.remove(f)
+
+def run_db(con, schema, seqid, create=False):
+    """
+    (connection, schema) having bulk rows of SEQID: its run file
+    if it has one (or if CREATE and the catalog is partitioned),
+    the catalog otherwise.  a run file is opened for writing
+    (see commit)
+    """
+    if "partitions" not in schema:
+        return con, schema
+    if seqid in run_dbs:
+        return run_dbs[seqid]
+    files = [f for (f,) in do_sql(con, "select file from partitions where seqid = ?",
+                                  1, seqid)]
+    if len(files) == 0:
+        if not create:
+            return con, schema
+        # the file of SEQID deleted in this transaction (e.g., by
+        # reingest) stays until it is committed
+        n = 0
+        while os.path.join(catalog_dir(con), run_file(seqid, n)) in dropped_run_files:
+            n += 1
+        files = [run_file(seqid, n)]
+        # a file may be left by a transaction (allocating seqid)
+        # rolled back after the file was committed
+        remove_run_file(os.path.join(catalog_dir(con), files[0]))
+        insert_row(con, schema, "partitions", dict(file=files[0]), seqid)
+    path = os.path.join(catalog_dir(con), files[0])
+    ensure_directory(os.path.dirname(path))
+    rcon = sqlite3.connect(path, timeout=busy_timeout)
+    rcon.row_factory = sqlite3.Row
+    # rows are deleted only by compact_runs; give the pages back.
+    # a run file is not in WAL mode, as read-only connections of
+    # viewers would leave -wal and -shm files of every run behind
+    do_sql(rcon, "pragma auto_vacuum = full", 1)
+    retry_busy(rcon, "begin immediate")
+    rschema = read_schema(rcon)
+    if "run" not in rschema:
+        ensure_columns(rcon, rschema, "run", ["seqid integer"])
+        do_sql(rcon, "insert into run(seqid) values(?)", 1, seqid)
+        ensure_columns(rcon, rschema, "kernel_calls", kernel_calls_columns)
+    run_dbs[seqid] = (rcon, rschema)
+    return rcon, rschema
+
+def drop_run_files(con, schema, seqids):
+    """
+    run files of SEQIDS, being deleted from the catalog in the
+    transaction, are to be removed once it is committed (see commit)
+    """
+    if "partitions" not in schema:
+        return
+    for seqid in seqids:
+        if seqid in run_dbs:
+            rcon, _ = run_dbs.pop(seqid)
+            rcon.rollback()
+            rcon.close()
+        files = {f for (f,) in do_sql(con, "select file from partitions where seqid = ?",
+                                      1, seqid)}
+        for f in sorted(files | {run_file(seqid)}):
+            path = os.path.join(catalog_dir(con), f)
+            if os.path.exists(path) and path not in dropped_run_files:
+                dropped_run_files.append(path)
+
+# kernel_times of a run file opened by open_run_file, joining its
+# kernel_calls with kernels of the catalog
+run_kernel_times_view = """create temp view kernel_times as
+select c.seqid, c.t0, c.t1, k.cls, k.cargs, k.fun, k.fargs, c.dt, c.train_test, c.a, c.b
+from main.kernel_calls c join catalog.kernels k on c.kernel_id = k.kernel_id"""
+
+def open_run_file(con, path, kernel_times=False):
+    """
+    open run file PATH of the catalog CON read-only (so that
+    neither is locked).  with KERNEL_TIMES, the catalog is attached
+    as catalog and view kernel_times created, so that queries of it
+    work as on the catalog (attaching takes longer than opening)
+    """
+    rcon = sqlite3.connect("file:{}?mode=ro".format(path), uri=True, timeout=busy_timeout)
+    rcon.row_factory = sqlite3.Row
+    if not kernel_times:
+        return rcon
+    try:
+        for row in do_sql(con, "pragma database_list", 1):
+            if row[1] == "main":
+                do_sql(rcon, "attach database ? as catalog", 1, "file:{}?mode=ro".format(row[2]))
+        do_sql(rcon, run_kernel_times_view, 1)
+    except BaseException:
+        rcon.close()
+        raise
+    return rcon
+
+def run_rows(con, schema, seqids, cmd, *vals):
+    """
+    rows of query CMD (with "seqid = ?" for the first of VALS,
+    which are given after it) on bulk rows (and kernel_times) of
+    each of SEQIDS, reading the run file of those having one (see
+    open_run_file) and the catalog for the others.  a run whose file
+    is gone (it has been deleted since partitions was read) has no rows
+    """
+    files = {}
+    if "partitions" in schema:
+        files = {seqid : f for seqid, f in do_sql(con, "select seqid, file from partitions", 1)}
+    rows = []
+    for seqid in seqids:
+        if seqid not in files:
+            rows.extend(do_sql(con, cmd, 1, seqid, *vals))
+            continue
+        path = os.path.join(catalog_dir(con), files[seqid])
+        try:
+            rcon = open_run_file(con, path, "kernel_times" in cmd)
+        except sqlite3.OperationalError:
+            if os.path.exists(path):
+                raise
+            continue
+        try:
+            rows.extend(do_sql(rcon, cmd, 1, seqid, *vals))
+        except sqlite3.OperationalError as err:
+            # a run without rows of some tables
+            if "no such table" not in str(err):
+                raise
+        finally:
+            rcon.close()
+    return rows
+
+def partition_db(con, schema):
+    """
+    make the catalog partitioned (see run_db), moving rows of
+    event_tables of existing runs to their run files.
+    return the number of runs moved
+    """
+    ensure_columns(con, schema, "partitions", partitions_columns)
+    do_sql(con, "pragma secure_delete = off", 1)
+    # runs still being inserted (-f, -c) keep their rows where they are
+    seqids = [seqid for (seqid,) in do_sql(con, """select seqid from info
+    where ifnull(finished, 1) != 0 and seqid not in (select seqid from partitions)
+    order by seqid""", 1)]
+    for seqid in seqids:
+        rcon, rschema = run_db(con, schema, seqid, True)
+        for tbl in event_tables.values():
+            if tbl in schema:
+                rows = [dict(row) for row in
+                        do_sql(con, "select * from {} where seqid = ?".format(tbl), 1, seqid)]
+                for row in rows:
+                    del row["seqid"]
+                insert_rows(rcon, rschema, tbl, rows, seqid)
+        for tbl in event_tables.values():
+            if tbl in schema:
+                do_sql(con, "delete from {} where seqid = ?".format(tbl), 1, seqid)
+    return len(seqids)
+
 def get_next_seqid(con):
     """
-    return next seqid
+    return next seqid.
+    increment the counter first so that it is never read
+    by two submissions
     """
-    [(seqid,)] = list(do_sql(con, "select x from seq_counter", 1))
-    do_sql(con, "update seq_counter set x = ?", 1, seqid + 1)
+    do_sql(con, "update seq_counter set x = x + 1", 1)
+    [(seqid,)] = list(do_sql(con, "select x - 1 from seq_counter", 1))
     return seqid
 
 def delete_from_db(con, schema, delete_seqids, delete_mine, user):
@@ -130,14 +831,25 @@ def delete_from_db(con, schema, delete_seqids, delete_mine, user):
         seqids = user_seqids
     else:
         seqids = delete_seqids.intersection(user_seqids)
-    if len(seqids) > 0:
-        seqids_comma = ",".join([("%d" % x) for x in sorted(list(seqids))])
-        for tbl, _ in schema.items():
-            if tbl != "seq_counter":
-                cmd = "delete from %s where seqid in (%s)" % (tbl, seqids_comma)
-                do_sql(con, cmd, 1)
+    delete_rows(con, schema, seqids)
     return seqids
 
+def delete_rows(con, schema, seqids):
+    """
+    delete rows of seqids from all tables.
+    each seqid is looked up in the seqid index of each table
+    (see table_indexes), so rows of other runs are not scanned.
+    freed pages are not overwritten with zeros (secure_delete,
+    on in some builds of sqlite), which would write them all again
+    """
+    if len(seqids) > 0:
+        do_sql(con, "pragma secure_delete = off", 1)
+        drop_run_files(con, schema, seqids)
+        rows = [(x,) for x in sorted(seqids)]
+        for tbl in schema:
+            if "seqid" in schema_names(schema, tbl):
+                do_sql_many(con, "delete from %s where seqid = ?" % tbl, 1, rows)
+
 def parse_val(x):
     """
     parse a string into an sqlite3 value
@@ -171,12 +883,26 @@ def insert_row(con, schema, tbl, row, seqid):
 
 def insert_rows(con, schema, tbl, rows, seqid):
     """
-    insert rows into database
+    insert rows into database at once.  columns of all rows
+    are added to the table first and all rows are inserted by
+    a single statement (missing columns of a row are null)
     """
-    n_inserted = 0
+    if len(rows) == 0:
+        return 0
+    rows = [{k.replace("-", "_") : v for k, v in row.items()} for row in rows]
+    fields = ["seqid"]
+    key_sets = set()
     for row in rows:
-        n_inserted += insert_row(con, schema, tbl, row, seqid)
-    return n_inserted
+        keys = tuple(row)
+        if keys not in key_sets:
+            key_sets.add(keys)
+            fields.extend(k for k in keys if k not in fields)
+    ins_cmd = ("insert into {}({}) values({})"
+               .format(tbl, ",".join(fields), ",".join(["?"] * len(fields))))
+    ensure_columns(con, schema, tbl, fields)
+    vals = [[seqid] + [row.get(f) for f in fields[1:]] for row in rows]
+    do_sql_many(con, ins_cmd, 2, vals)
+    return len(rows)
 
 def make_row_from_key_vals(rows):
     """
@@ -191,35 +917,671 @@ def make_row_from_key_vals(rows):
         dic[row["key"]] = row["val"]
     return keys, dic
 
-def insert_into_db(con, schema, user, logs):
+# table each kind of parse_log event goes to
+event_tables = {
+    "sample" : "samples",
+    "loss"   : "loss_accuracy",
+    "kernel" : "kernel_calls",
+}
+
+def open_queue_file(q_dir, suffix=".log"):
+    """
+    create a new file in Q_DIR to queue a raw log, named after
+    the time it is queued to the microsecond, so that names sort
+    in the order logs are queued (see ingestd.list_tickets)
+    """
+    now = time.time()
+    prefix = "{}.{:06d}-".format(time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(now)),
+                                 int(now % 1 * 1000000))
+    tmp_fd, q_log = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=q_dir)
+    return os.fdopen(tmp_fd, "wb"), q_log
+
+# variables of a log (key_vals) are stored in env as (seqid, key, val)
+# rows, except those below, which are promoted to typed columns of
+# info.  view info_all has all of them as columns, like info used
+# to have (a column was added to info for each new variable)
+info_columns = ["seqid integer", "owner text", "finished integer",
+                "start_at text", "end_at text", "host text", "algo_s text",
+                "batch_size integer", "epochs integer", "lr real",
+                "train_data_size integer", "test_data_size integer"]
+env_columns = ["seqid", "key", "val"]
+info_all_view = """create view info_all as select i.*{} from info i"""
+
+def update_info_view(con, keys):
+    """
+    make sure env_keys has KEYS and info_all has a column
+    for each of env_keys
+    """
+    known = {key for (key,) in do_sql(con, "select key from env_keys", 1)}
+    if known.issuperset(keys) and len(list(do_sql(con, "select name from sqlite_master"
+                                                 " where name = 'info_all'", 1))) > 0:
+        return
+    known.update(keys)
+    do_sql_many(con, "insert or ignore into env_keys(key) values(?)", 1,
+                [[key] for key in sorted(known)])
+    do_sql(con, "drop view if exists info_all", 1)
+    do_sql(con, info_all_view.format(
+        "".join(',(select val from env e where e.seqid = i.seqid and e.key = \'{0}\') as "{0}"'
+                .format(key) for key in sorted(known))), 1)
+
+def ensure_info_tables(con, schema):
     """
-    insert all records in plogs into database
+    ensure info (with typed columns), env and env_keys tables and
+    info_all view exist.  an info table of an old database having
+    a column for each variable is converted into them
     """
-    seqids = []
-    for parsed, _ in logs:
+    if "env" in schema:
+        return
+    old_columns = None
+    if "info" in schema:
+        old_columns = [col.split()[0] for col in schema.pop("info")]
+        do_sql(con, "alter table info rename to info_old", 1)
+        for (idx,) in list(do_sql(con, "select name from sqlite_master"
+                                  " where type = 'index' and tbl_name = 'info_old'"
+                                  " and sql is not null", 1)):
+            do_sql(con, "drop index {}".format(idx), 1)
+    ensure_columns(con, schema, "info", info_columns)
+    ensure_columns(con, schema, "env", env_columns)
+    ensure_columns(con, schema, "env_keys", ["key text primary key"])
+    keys = []
+    if old_columns is not None:
+        promoted = [col for col in old_columns if col in schema_names(schema, "info")]
+        do_sql(con, "insert into info({0}) select {0} from info_old".format(",".join(promoted)), 1)
+        keys = [col for col in old_columns if col not in promoted]
+        for key in keys:
+            do_sql(con, """insert into env(seqid, key, val)
+            select seqid, ?, "{0}" from info_old where "{0}" is not null""".format(key), 1, key)
+        do_sql(con, "drop table info_old", 1)
+    update_info_view(con, keys)
+
+def schema_names(schema, tbl):
+    """
+    names of columns of TBL
+    """
+    return [col.split()[0] for col in schema.get(tbl, [])]
+
+def insert_info(con, schema, user, key_vals, seqid, finished):
+    """
+    insert the info (and env) rows of seqid, replacing provisional
+    ones if any
+    """
+    key_vals = key_vals + [dict(key="owner", val=user),
+                           dict(key="finished", val=finished)]
+    _, dic = make_row_from_key_vals(key_vals)
+    dic = {k.replace("-", "_") : v for k, v in dic.items()}
+    promoted = schema_names(schema, "info")
+    info = {k : v for k, v in dic.items() if k in promoted}
+    env = [dict(key=k, val=v) for k, v in dic.items() if k not in promoted]
+    do_sql(con, "delete from info where seqid = ?", 1, seqid)
+    do_sql(con, "delete from env where seqid = ?", 1, seqid)
+    insert_row(con, schema, "info", info, seqid)
+    insert_rows(con, schema, "env", env, seqid)
+    update_info_view(con, [row["key"] for row in env])
+
+def log_ident(log):
+    """
+    identify a log file by its path and its first line
+    ("open a log <date>", decompressed if the log is compressed)
+    """
+    with parse_log.open_raw_log(log) as fp:
+        compression, _ = parse_log.log_compression(fp)
+        line = parse_log.decompress(fp, compression).readline()
+    return "{}:{}".format(os.path.realpath(log), hashlib.sha1(line).hexdigest())
+
+def log_digest(log):
+    """
+    sha256 of the contents of LOG file, decompressed if it is
+    compressed, so that a log and a compressed copy of it
+    (or copies compressed differently) have the same digest
+    """
+    digest = hashlib.sha256()
+    with open(log, "rb") as fp:
+        compression, _ = parse_log.log_compression(fp)
+        zp = parse_log.decompress(fp, compression)
+        for data in iter(lambda: zp.read(1 << 20), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+def find_log(con, schema, digest):
+    """
+    seqid of a run whose log has DIGEST (see log_digest), or None
+    """
+    if "log_hashes" not in schema:
+        return None
+    for (seqid,) in do_sql(con, "select seqid from log_hashes where hash = ?", 1, digest):
+        return seqid
+    return None
+
+def duplicate_log(con, user, log, seqid, relink):
+    """
+    LOG is identical to the log of SEQID, already in the database.
+    with RELINK, make USER the owner of SEQID.  return SEQID
+    """
+    if relink:
+        do_sql(con, "update info set owner = ? where seqid = ?", 1, user, seqid)
+        Es("{} is identical to seqid {}; it is now owned by {}\n".format(log, seqid, user))
+    else:
+        Es("{} is identical to seqid {}; skipped\n".format(log, seqid))
+    return seqid
+
+def backfill_log_hashes(con, schema, c_dir):
+    """
+    record digests of logs in C_DIR (commit/, where raw logs were
+    kept as SEQID-... before the store) of runs inserted before
+    log_hashes was introduced.  return those of runs in the database,
+    to be moved to the store (see store_log) once committed
+    """
+    if not os.path.isdir(c_dir):
+        return []
+    known = set()
+    if "log_hashes" in schema:
+        known = {seqid for (seqid,) in do_sql(con, "select seqid from log_hashes", 1)}
+    runs = set()
+    if "info" in schema:
+        runs = {seqid for (seqid,) in do_sql(con, "select seqid from info", 1)}
+    logs = []
+    for name in sorted(os.listdir(c_dir)):
+        seqid = name.split("-")[0]
+        if seqid.isdigit() and int(seqid) in runs:
+            log = os.path.join(c_dir, name)
+            if int(seqid) not in known:
+                insert_rows(con, schema, "log_hashes", [{"hash" : log_digest(log)}], int(seqid))
+                known.add(int(seqid))
+            logs.append(log)
+    return logs
+
+# raw logs are kept in the store (DATA/store), named after their
+# digest (see log_digest, the same however they are compressed) and
+# compressed with gzip unless they were submitted compressed;
+# log_hashes maps seqids to them
+stored_suffixes = [suffix for _, _, suffix in parse_log.compressions]
+
+def stored_log_path(s_dir, digest, suffix):
+    """
+    path of the log of DIGEST in the store S_DIR
+    """
+    return os.path.join(s_dir, digest[:2], digest + suffix)
+
+def stored_log(s_dir, digest):
+    """
+    the log of DIGEST in the store S_DIR (whichever compression
+    it is stored with), or None
+    """
+    for suffix in stored_suffixes:
+        path = stored_log_path(s_dir, digest, suffix)
+        if os.path.exists(path):
+            return path
+    return None
+
+def store_log(log, s_dir):
+    """
+    move LOG (a queued copy of a raw log) into the store S_DIR,
+    compressing it unless it is compressed.  the store keeps a
+    single file of the same contents, however compressed.
+    return the stored file
+    """
+    digest = log_digest(log)
+    dest = stored_log(s_dir, digest)
+    if dest is not None:
+        os.remove(log)
+        return dest
+    compression, suffix = parse_log.get_log_compression(log)
+    ensure_directory(os.path.join(s_dir, digest[:2]))
+    if compression is not None:
+        dest = stored_log_path(s_dir, digest, suffix)
+        os.rename(log, dest)
+        return dest
+    dest = stored_log_path(s_dir, digest, ".log.gz")
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest))
+    with open(log, "rb") as fp, os.fdopen(fd, "wb") as wp:
+        with gzip.GzipFile(filename="", mode="wb", fileobj=wp, mtime=0) as zp:
+            shutil.copyfileobj(fp, zp, 1 << 20)
+    os.rename(tmp, dest)
+    os.remove(log)
+    return dest
+
+def find_stored_log(con, schema, s_dir, seqid):
+    """
+    the stored log of SEQID, or None.  parse_log reads it as it is
+    (decompressing it as it goes)
+    """
+    if "log_hashes" not in schema:
+        return None
+    for (digest,) in do_sql(con, "select hash from log_hashes where seqid = ?", 1, seqid):
+        return stored_log(s_dir, digest)
+    return None
+
+def reingest(con, schema, s_dir, seqids):
+    """
+    parse stored logs of SEQIDS (all runs if None) again and replace
+    their rows, keeping their seqids and owners (e.g., after the
+    schema has changed).  return seqids reingested
+    """
+    if seqids is None:
+        seqids = [seqid for (seqid,) in do_sql(con, "select seqid from info order by seqid", 1)]
+    done = []
+    kernel_ids = {}
+    for seqid in seqids:
+        log = find_stored_log(con, schema, s_dir, seqid)
+        if log is None:
+            Es("warning: no stored log of seqid {}\n".format(seqid))
+            continue
+        [(owner,)] = do_sql(con, "select owner from info where seqid = ?", 1, seqid)
+        events = event_batches(log)
+        [(digest,)] = do_sql(con, "select hash from log_hashes where seqid = ?", 1, seqid)
+        delete_rows(con, schema, [seqid])
+        insert_parsed(con, schema, owner, events, kernel_ids, digest, seqid)
+        done.append(seqid)
+    return done
+
+def save_checkpoint(con, schema, seqid, ident, q_log, ckpt, key_vals):
+    """
+    record where parsing of the log identified by IDENT is,
+    along with the last rowid of each table committed with it
+    """
+    rowids = {}
+    rcon, rschema = run_db(con, schema, seqid)
+    for tbl in event_tables.values():
+        if tbl in rschema:
+            [(rowid,)] = list(do_sql(rcon, "select max(rowid) from {}".format(tbl), 1))
+            rowids[tbl] = rowid
+    state = dict(ckpt, key_vals=key_vals, rowids=rowids)
+    if "checkpoints" in schema:
+        do_sql(con, "delete from checkpoints where seqid = ?", 1, seqid)
+    insert_row(con, schema, "checkpoints",
+               dict(ident=ident, q_log=q_log, state=json.dumps(state)), seqid)
+
+def load_checkpoint(con, schema, ident):
+    """
+    the last checkpoint saved for the log identified by IDENT,
+    as (seqid, queued file, state), or None
+    """
+    if "checkpoints" not in schema:
+        return None
+    rows = list(do_sql(con, "select seqid, q_log, state from checkpoints where ident = ?",
+                       1, ident))
+    if len(rows) == 0:
+        return None
+    row = rows[-1]
+    return row["seqid"], row["q_log"], json.loads(row["state"])
+
+def resume_log(con, schema, ident):
+    """
+    prepare to resume inserting the log identified by IDENT
+    from its last checkpoint.  return (seqid, queue file opened
+    for append, its path, checkpoint state) or None
+    """
+    ckpt = load_checkpoint(con, schema, ident)
+    if ckpt is None:
+        return None
+    seqid, q_log, state = ckpt
+    if not os.path.exists(q_log):
+        # the raw log queued so far is gone; start over
+        delete_rows(con, schema, [seqid])
+        return None
+    rcon, rschema = run_db(con, schema, seqid)
+    for tbl, rowid in state["rowids"].items():
+        if rowid is None:
+            continue
+        last = None
+        if tbl in rschema:
+            [(last,)] = list(do_sql(rcon, "select max(rowid) from {}".format(tbl), 1))
+        if last is None or last < rowid:
+            # the catalog was committed but the run file was not
+            # (see commit); start over
+            delete_rows(con, schema, [seqid])
+            return None
+        # forget rows and raw log written after the checkpoint
+        do_sql(rcon, "delete from {} where seqid = ? and rowid > ?".format(tbl),
+               1, seqid, rowid)
+    os.truncate(q_log, state.get("copy_offset", state["offset"]))
+    Es("resuming {} (seqid {}) from offset {}\n".format(ident, seqid, state["offset"]))
+    return seqid, open(q_log, "ab"), q_log, state
+
+def flush_rows(con, schema, pending, seqid, kernel_ids, stats):
+    """
+    insert rows in PENDING (table -> rows) and empty it,
+    beginning a transaction if none is in progress.
+    kernel events become kernel_calls rows (and are added
+    to STATS) only here, as interning kernels writes
+    """
+    if not con.in_transaction:
+        begin_transaction(con, schema)
+    calls = pending["kernel_calls"]
+    for i, data in enumerate(calls):
+        calls[i] = make_kernel_call(con, schema, kernel_ids, data)
+        add_kernel_stat(stats, calls[i])
+    rcon, rschema = run_db(con, schema, seqid)
+    for tbl, rows in pending.items():
+        insert_rows(rcon, rschema, tbl, rows, seqid)
+        del rows[:]
+
+def insert_log(con, schema, user, log, q_dir, follow=None, checkpoint=None, relink=False):
+    """
+    parse LOG and insert its records into database as they are parsed,
+    copying the raw log into a file in Q_DIR on the way, so that
+    memory use does not grow with the size of the log.
+    a compressed LOG is queued as it is (compressed).
+    with FOLLOW (seconds), LOG is still being written; wait for it
+    to grow and commit what has been parsed every FOLLOW seconds,
+    with the info row marked finished = 0 until "close a log".
+    with CHECKPOINT (seconds), commit what has been parsed every
+    CHECKPOINT seconds the same way.  each commit records where
+    parsing is, so a later invocation on the same file resumes from
+    there if this one is killed or interrupted (what has been committed
+    is removed if the log cannot be parsed).
+    statistics of kernel execution times (kernel_stats) are
+    accumulated as kernel_calls rows are inserted and written
+    along with info.
+    with FOLLOW or CHECKPOINT, rows are kept until the next commit
+    and the database is not locked in between, so that waiting for
+    the log or parsing it does not hold off other submissions.
+    a log identical to one already in the database (see log_digest)
+    is not inserted (with RELINK, the run is given to USER instead).
+    a log file is known to be so before parsing it; stdin or a log
+    being followed only after that.
+    return the seqid and the queued file (None if LOG is a duplicate)
+    """
+    interval = follow if follow is not None else checkpoint
+    digest = None
+    if follow is None and log != "-":
+        digest = log_digest(log)
+        dup = find_log(con, schema, digest)
+        if dup is not None:
+            return duplicate_log(con, user, log, dup, relink), None
+    resumed = None
+    ident = None
+    if interval is not None and log != "-":
+        ident = log_ident(log)
+        resumed = resume_log(con, schema, ident)
+    if resumed is None:
         seqid = get_next_seqid(con)
-        seqids.append(seqid)
-        for tbl, rows in parsed.items():
-            if tbl == "key_vals":
-                rows.append(dict(key="owner", val=user))
-                _, dic = make_row_from_key_vals(rows)
-                insert_row(con, schema, "info", dic, seqid)
+        run_db(con, schema, seqid, True)
+        key_vals = []
+        _, suffix = parse_log.get_log_compression(log)
+        tmp_wp, q_log = open_queue_file(q_dir, suffix)
+        resume = None
+        stats = {}
+    else:
+        seqid, tmp_wp, q_log, resume = resumed
+        key_vals = resume["key_vals"]
+        stats = load_kernel_stats(con, schema, seqid)
+    if interval is not None:
+        commit(con)
+    kernel_ids = {}
+    # rows of a batch (or of an interval) are inserted together
+    pending = {tbl : [] for tbl in event_tables.values()}
+    last_commit = time.time()
+    checkpointed = resumed is not None
+    done = 0
+    keep = 0
+    try:
+        for kind, data in parse_log.stream_log(log, follow is not None, resume, tmp_wp):
+            if kind == "env":
+                key_vals.append(data)
+            elif kind in event_tables:
+                pending[event_tables[kind]].append(data)
+            elif kind == "checkpoint":
+                if interval is None:
+                    flush_rows(con, schema, pending, seqid, kernel_ids, stats)
+                elif time.time() - last_commit >= interval:
+                    flush_rows(con, schema, pending, seqid, kernel_ids, stats)
+                    insert_info(con, schema, user, key_vals, seqid, 0)
+                    save_kernel_stats(con, schema, stats, seqid)
+                    save_run_summary(con, schema, seqid)
+                    if ident is not None:
+                        save_checkpoint(con, schema, seqid, ident, q_log, data, key_vals)
+                        checkpointed = 1
+                    tmp_wp.flush()
+                    commit(con)
+                    last_commit = time.time()
+        flush_rows(con, schema, pending, seqid, kernel_ids, stats)
+        done = 1
+    except (KeyboardInterrupt, SystemExit):
+        # interrupted (e.g., ^C), not failed.  keep what has been
+        # committed, its checkpoint and the queued file, so that
+        # submitting the same file again resumes from there
+        keep = checkpointed
+        raise
+    finally:
+        tmp_wp.close()
+        if not done and not keep:
+            os.remove(q_log)
+            if interval is not None:
+                # remove what has been committed
+                rollback(con)
+                begin_transaction(con, schema)
+                delete_rows(con, schema, [seqid])
+                commit(con)
+    if "checkpoints" in schema:
+        do_sql(con, "delete from checkpoints where seqid = ?", 1, seqid)
+    if digest is None:
+        # the queued file is a copy of the log
+        digest = log_digest(q_log)
+    # look up again, as an identical log may have been inserted
+    # by another submission since the first lookup
+    dup = find_log(con, schema, digest)
+    if dup is not None:
+        delete_rows(con, schema, [seqid])
+        os.remove(q_log)
+        return duplicate_log(con, user, log, dup, relink), None
+    save_kernel_stats(con, schema, stats, seqid)
+    insert_info(con, schema, user, key_vals, seqid, 1)
+    save_run_summary(con, schema, seqid)
+    save_confusion(con, schema, seqid)
+    insert_rows(con, schema, "meta", parse_log.get_meta(), seqid)
+    insert_rows(con, schema, "log_hashes", [{"hash" : digest}], seqid)
+    return seqid, q_log
+
+def event_batches(log):
+    """
+    parse LOG, generating lists of events insert_parsed inserts,
+    a batch (up to a checkpoint event of parse_log.stream_log)
+    at a time
+    """
+    batch = []
+    for kind, data in parse_log.stream_log(log):
+        if kind == "checkpoint":
+            yield batch
+            batch = []
+        elif kind == "env" or kind in event_tables:
+            batch.append((kind, data))
+    yield batch
+
+def parse_events(log):
+    """
+    parse LOG into a temporary file of event_batches (run in a
+    worker process), so that what goes back to the parent process
+    is its name, not the events, which may be as large as the log.
+    return the file (see read_events)
+    """
+    fd, path = tempfile.mkstemp(prefix="events", suffix=".pickle")
+    try:
+        with os.fdopen(fd, "wb") as wp:
+            for batch in event_batches(log):
+                pickle.dump(batch, wp, pickle.HIGHEST_PROTOCOL)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def read_events(path):
+    """
+    batches of events parse_events wrote into PATH, read
+    one at a time
+    """
+    with open(path, "rb") as fp:
+        while 1:
+            try:
+                yield pickle.load(fp)
+            except EOFError:
+                return
+
+def insert_parsed(con, schema, user, batches, kernel_ids, digest, seqid=None):
+    """
+    insert records of a log already parsed into BATCHES (lists
+    of events of parse_log.stream_log; see event_batches) with
+    SEQID (a new one if None), a batch at a time, so that memory
+    use does not grow with the size of the log.
+    KERNEL_IDS caches kernel ids (see get_kernel_id) and may be
+    shared by logs inserted in the same transaction.
+    DIGEST is log_digest of the log.
+    return the seqid
+    """
+    if seqid is None:
+        seqid = get_next_seqid(con)
+    run_db(con, schema, seqid, True)
+    key_vals = []
+    stats = {}
+    pending = {tbl : [] for tbl in event_tables.values()}
+    for events in batches:
+        for kind, data in events:
+            if kind == "env":
+                key_vals.append(data)
             else:
-                insert_rows(con, schema, tbl, rows, seqid)
-    return seqids
+                pending[event_tables[kind]].append(data)
+        flush_rows(con, schema, pending, seqid, kernel_ids, stats)
+    save_kernel_stats(con, schema, stats, seqid)
+    insert_info(con, schema, user, key_vals, seqid, 1)
+    save_run_summary(con, schema, seqid)
+    save_confusion(con, schema, seqid)
+    insert_rows(con, schema, "meta", parse_log.get_meta(), seqid)
+    insert_rows(con, schema, "log_hashes", [{"hash" : digest}], seqid)
+    return seqid
+
+def sync_dir(dire):
+    """
+    make entries created or renamed in DIRE durable
+    """
+    fd = os.open(dire, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def queue_log(log, q_dir, user, relink=False):
+    """
+    copy LOG (as it is, compressed or not) into a new file in Q_DIR
+    and put a ticket (the file + ".json") next to it, telling
+    ingestd.py to insert it on behalf of USER (or, if it is a
+    duplicate, to give the run to USER with RELINK).
+    the ticket appears only after the copy is on disk, so whatever
+    has a ticket survives a crash.  return the queued file
+    """
+    _, suffix = parse_log.get_log_compression(log)
+    wp, q_log = open_queue_file(q_dir, suffix)
+    fp = parse_log.open_raw_log(log)
+    try:
+        with wp:
+            shutil.copyfileobj(fp, wp)
+            wp.flush()
+            os.fsync(wp.fileno())
+    finally:
+        if log != "-":
+            fp.close()
+    ticket = "{}.json".format(q_log)
+    with open("{}.tmp".format(ticket), "w") as wp:
+        json.dump(dict(log=os.path.basename(q_log), owner=user, relink=relink,
+                       queued_at=time.strftime("%Y-%m-%dT%H-%M-%S")), wp)
+        wp.flush()
+        os.fsync(wp.fileno())
+    os.rename("{}.tmp".format(ticket), ticket)
+    sync_dir(q_dir)
+    return q_log
+
+def insert_parsed_log(con, schema, user, log, digest, job, q_dir, kernel_ids, relink):
+    """
+    insert LOG parsed by JOB (parse_events in a pool) unless it is
+    a duplicate, and queue it.  JOB is None if LOG was known to be
+    a duplicate when it was given to the pool.
+    return the seqid and the queued file (None if LOG is a duplicate)
+    """
+    path = None if job is None else job.get()
+    try:
+        dup = find_log(con, schema, digest)
+        if dup is not None:
+            return duplicate_log(con, user, log, dup, relink), None
+        seqid = insert_parsed(con, schema, user, read_events(path), kernel_ids, digest)
+    finally:
+        if path is not None:
+            os.remove(path)
+    _, suffix = parse_log.get_log_compression(log)
+    wp, q_log = open_queue_file(q_dir, suffix)
+    with wp, open(log, "rb") as fp:
+        shutil.copyfileobj(fp, wp)
+    return seqid, q_log
+
+def insert_logs_parallel(con, schema, user, logs, q_dir, jobs, relink):
+    """
+    insert LOGS (files), parsing them in JOBS worker processes.
+    they are inserted (by this process) in the order of LOGS, so
+    they get the same seqids as when inserted one by one.
+    logs are parsed at most 2 * JOBS ahead of inserting, and
+    duplicates (of logs in the database or earlier in LOGS) are
+    not parsed.  parsed events come back in files (see parse_events),
+    so memory use does not grow with the size of logs or JOBS.
+    return a list of (seqid, queued file or None) in the order of LOGS
+    """
+    results = []
+    kernel_ids = {}
+    seen = set()
+    ahead = collections.deque()
+    with multiprocessing.Pool(jobs) as pool:
+        try:
+            for log in logs:
+                digest = log_digest(log)
+                job = None
+                if digest not in seen and find_log(con, schema, digest) is None:
+                    job = pool.apply_async(parse_events, (log,))
+                seen.add(digest)
+                ahead.append((log, digest, job))
+                if len(ahead) > 2 * jobs:
+                    results.append(insert_parsed_log(con, schema, user, *ahead.popleft(),
+                                                     q_dir, kernel_ids, relink))
+            while len(ahead) > 0:
+                results.append(insert_parsed_log(con, schema, user, *ahead.popleft(),
+                                                 q_dir, kernel_ids, relink))
+        finally:
+            # files of logs parsed but not inserted
+            for _, _, job in ahead:
+                if job is not None and job.ready() and job.successful():
+                    os.remove(job.get())
+    return results
+
+def insert_into_db(con, schema, user, logs, q_dir, follow=None, checkpoint=None,
+                   relink=False, jobs=1):
+    """
+    parse all files in logs and insert their records into database.
+    with JOBS > 1, files are parsed in parallel (see insert_logs_parallel)
+    unless following, checkpointing or reading stdin.
+    return a list of (seqid, queued file) and seqids of duplicates
+    """
+    inserted = []
+    duplicates = []
+    if jobs > 1 and follow is None and checkpoint is None and "-" not in logs:
+        results = insert_logs_parallel(con, schema, user, logs, q_dir, jobs, relink)
+    else:
+        results = [insert_log(con, schema, user, log, q_dir, follow, checkpoint, relink)
+                   for log in logs]
+    for seqid, q_log in results:
+        if q_log is None:
+            duplicates.append(seqid)
+        else:
+            inserted.append((seqid, q_log))
+    return inserted, duplicates
 
 def ensure_data_dir(data_dir):
     """
-    ensure directories data_dir/{queue,commit,deleted} exist
+    ensure directories data_dir/{queue,store,deleted} exist
     """
     queue_dir = "{}/queue".format(data_dir)
-    commit_dir = "{}/commit".format(data_dir)
+    store_dir = "{}/store".format(data_dir)
     deleted_dir = "{}/deleted".format(data_dir)
     ensure_directory(data_dir)
     ensure_directory(queue_dir)
-    ensure_directory(commit_dir)
+    ensure_directory(store_dir)
     ensure_directory(deleted_dir)
-    return queue_dir, commit_dir, deleted_dir
+    return queue_dir, store_dir, deleted_dir
 
 # ------------------------------
 
@@ -238,31 +1600,64 @@ def parse_delete_seqids(delete_seqids):
         Es("argument to --delete-seqids must be N,N,...\n")
     return ids
 
-def parse_logs(logs, q_dir):
+def parse_reingest_seqids(reingest_seqids):
     """
-    parse all files in logs
+    "1,2,3" --> [1,2,3], "all" --> None (all runs)
     """
-    result = []
-    for log in logs:
-        parsed, raw_data = parse_log.parse_log(log)
-        if q_dir is None:
-            q_log = None
-        else:
-            prefix = time.strftime("%Y-%m-%d-%H-%M-%S")
-            tmp_fd, q_log = tempfile.mkstemp(suffix=".log", prefix=prefix, dir=q_dir)
-            tmp_wp = os.fdopen(tmp_fd, "w")
-            tmp_wp.write(raw_data)
-            tmp_wp.close()
-        result.append((parsed, q_log))
-    return result
+    if reingest_seqids == "all":
+        return None
+    return parse_delete_seqids(reingest_seqids)
+
+def parse_one_log(log):
+    """
+    parse LOG, discarding what is parsed (for dry run)
+    """
+    for _ in parse_log.stream_log(log):
+        pass
+
+def parse_logs(logs, jobs=1):
+    """
+    parse all files in logs (for dry run), in JOBS processes
+    """
+    if jobs > 1 and "-" not in logs:
+        with multiprocessing.Pool(jobs) as pool:
+            for _ in pool.imap(parse_one_log, logs):
+                pass
+    else:
+        for log in logs:
+            parse_one_log(log)
+
+# pages reclaimed in a transaction by vacuum_db
+vacuum_step = 2048
 
-def move_to_dir(file, seqid, to_dir):
+def vacuum_db(con, step):
     """
-    move FILE to TO_DIR/SEQID-FILE
+    return pages freed (e.g., by deleting runs) to the file system,
+    STEP pages at a time, each in a short transaction so that other
+    submissions are not kept waiting (and readers never are).
+    a database created before auto_vacuum = incremental is first
+    converted with a VACUUM, which rewrites and locks the whole
+    database once.  return seconds each step took
     """
-    _, orig_file = os.path.split(file)
-    dest_file = "{}/{:06d}-{}".format(to_dir, seqid, orig_file)
-    os.rename(file, dest_file)
+    [(mode,)] = do_sql(con, "pragma auto_vacuum", 1).fetchall()
+    if mode != 2:
+        Es("converting the database to incremental vacuum (once)\n")
+        do_sql(con, "pragma auto_vacuum = incremental", 1)
+        retry_busy(con, "vacuum")
+    steps = []
+    while 1:
+        [(free,)] = do_sql(con, "pragma freelist_count", 1).fetchall()
+        if free == 0:
+            break
+        t0 = time.time()
+        # execute() would run the pragma one page at a time;
+        # a script runs it to the end
+        retry_busy(con, "begin immediate; pragma incremental_vacuum({}); commit"
+                   .format(step), True)
+        steps.append(time.time() - t0)
+    # move reclaimed pages from WAL to the database and truncate both
+    do_sql(con, "pragma wal_checkpoint(truncate)", 1).fetchall()
+    return steps
 
 def create_file(seqid, dire):
     """
@@ -286,10 +1681,27 @@ def get_euser():
     uid = os.geteuid()
     return pwd.getpwuid(uid).pw_name
 
+def owner_only(options):
+    """
+    check none of OPTIONS, a list of (option, whether it is given),
+    is given by a user other than the owner of the command.
+    submit runs setuid to its owner (see setuid_submit.c) and these
+    write files the user chooses, or change or lock the whole
+    database, with the owner's permission
+    """
+    user = get_user()
+    euser = get_euser()
+    given = [option for option, is_given in options if is_given]
+    if user != euser and len(given) > 0:
+        Es("you ({}) cannot specify {}; only {} can\n".format(user, ", ".join(given), euser))
+        return 0
+    return 1
+
 def parse_args(argv):
     """
     parse command line args
     """
+    global dbg, busy_timeout, busy_retries
     psr = argparse.ArgumentParser()
     psr.add_argument("files", metavar="FILE",
                      nargs="*", help="files to submit")
@@ -310,6 +1722,58 @@ def parse_args(argv):
     psr.add_argument("--delete-mine", "-D",
                      action="store_true",
                      help="delete all data of submitting user")
+    psr.add_argument("--follow", "-f", metavar="SECONDS",
+                     type=float, nargs="?", const=10.0,
+                     help=("follow a log still being written (e.g., by a running mnist),"
+                           " committing what has been parsed every SECONDS (default: 10)"))
+    psr.add_argument("--checkpoint", "-c", metavar="SECONDS",
+                     type=float, nargs="?", const=60.0,
+                     help=("commit what has been parsed every SECONDS (default: 60),"
+                           " so that submitting the same file again resumes from"
+                           " the last commit if this one is killed"))
+    psr.add_argument("--enqueue", "-q", action="store_true",
+                     help=("only put FILEs in the queue and return; the ingest"
+                           " daemon (ingestd.py) inserts them into the database"))
+    psr.add_argument("--jobs", "-j", metavar="N", type=int, default=1,
+                     help=("parse FILEs in N processes (they are still inserted"
+                           " in the order given, getting the same seqids)"))
+    psr.add_argument("--relink", action="store_true",
+                     help=("when a FILE is identical to a log already submitted,"
+                           " make USER the owner of that run (default: just skip it)"))
+    psr.add_argument("--migrate", action="store_true",
+                     help=("only bring the database up to date (tables, views"
+                           " and indexes submit would create), move raw logs"
+                           " in commit/ to the store and analyze it"))
+    psr.add_argument("--partition", action="store_true",
+                     help=("from now on, keep samples, loss_accuracy and kernel_calls"
+                           " of each run in a file of its own (runs/SEQID.sqlite),"
+                           " moving those of runs already in the database"))
+    psr.add_argument("--reingest", metavar="ID,ID,...|all",
+                     help=("parse stored logs of specified seqids (or all runs) again"
+                           " and replace their records (e.g., after the schema has changed)"))
+    psr.add_argument("--compact-before", metavar="YYYY-MM-DD",
+                     help=("compact runs started before the date: delete their"
+                           " kernel_calls and samples, keeping kernel_stats and"
+                           " confusion (--reingest restores them)"))
+    psr.add_argument("--compact-keep", metavar="N", type=int,
+                     help="compact runs of each user but the N most recent ones")
+    psr.add_argument("--vacuum", metavar="PAGES", type=int, nargs="?", const=vacuum_step,
+                     help=("afterwards, return space freed by deleted runs to the"
+                           " file system, PAGES pages (default: %(const)s) per"
+                           " transaction so that other submissions are not kept waiting"))
+    psr.add_argument("--busy-timeout", metavar="SECONDS",
+                     type=float, default=busy_timeout,
+                     help=("wait up to SECONDS for other submissions holding"
+                           " the database before retrying (default: %(default)s)"))
+    psr.add_argument("--busy-retries", metavar="N",
+                     type=int, default=busy_retries,
+                     help=("retry N times with an exponential backoff when the"
+                           " database is still locked (default: %(default)s)"))
+    psr.add_argument("--profile", action="store_true",
+                     help=("print time spent in each stage (reading, tokenizing,"
+                           " inserting rows, committing, etc.)"))
+    psr.add_argument("--cprofile", metavar="FILE",
+                     help="write cProfile statistics of the whole run to FILE (see pstats)")
     psr.add_argument("--dbg", type=int, default=0,
                      help="specify debug level")
     opt = psr.parse_args(argv)
@@ -322,15 +1786,69 @@ def parse_args(argv):
             return None
     else:
         opt.pretend = get_user()
+    if opt.enqueue and (opt.follow is not None or opt.checkpoint is not None):
+        Es("--enqueue cannot be used with --follow or --checkpoint\n")
+        return None
     opt.delete_seqids = parse_delete_seqids(opt.delete_seqids)
     if opt.delete_seqids is None:
         return None
-    if len(opt.delete_seqids) == 0 and (not opt.delete_mine) and len(opt.files) == 0:
+    if opt.reingest is not None:
+        opt.reingest = parse_reingest_seqids(opt.reingest)
+        if opt.reingest == []:
+            return None
+    else:
+        opt.reingest = []
+    if opt.compact_before is not None:
+        before = parse_time(opt.compact_before + "T00-00-00")
+        if before is None:
+            Es("--compact-before {} is not YYYY-MM-DD\n".format(opt.compact_before))
+            return None
+        opt.compact_before = before
+    compact = opt.compact_before is not None or opt.compact_keep is not None
+    if (len(opt.delete_seqids) == 0 and (not opt.delete_mine) and (not opt.migrate)
+            and (not opt.partition) and opt.reingest == [] and not compact and opt.vacuum is None
+            and len(opt.files) == 0):
         opt.files.append("-")
-    global dbg
+    if not owner_only([("--data", opt.data != default_data_dir),
+                       ("--cprofile", opt.cprofile is not None),
+                       ("--relink", opt.relink),
+                       ("--migrate", opt.migrate),
+                       ("--partition", opt.partition),
+                       ("--reingest", opt.reingest != []),
+                       ("--compact-before", opt.compact_before is not None),
+                       ("--compact-keep", opt.compact_keep is not None),
+                       ("--vacuum", opt.vacuum is not None)]):
+        return None
     dbg = opt.dbg
+    busy_timeout = opt.busy_timeout
+    busy_retries = opt.busy_retries
     return opt
 
+def instrument(prof):
+    """
+    time stages of submitting logs with profiler prof
+    (see parse_log.profiler)
+    """
+    parse_log.instrument(prof)
+    mod = sys.modules[__name__]
+    for name, stage in [("open_for_transaction", "open database"),
+                        ("delete_rows", "delete rows"),
+                        ("compact_runs", "compact runs"),
+                        ("partition_db", "partition"),
+                        ("run_db", "open run files"),
+                        ("ensure_columns", "ensure_columns"),
+                        ("insert_row", "insert rows"),
+                        ("insert_rows", "insert rows"),
+                        ("get_kernel_id", "kernel ids"),
+                        ("add_kernel_stat", "kernel stats"),
+                        ("save_kernel_stats", "kernel stats"),
+                        ("save_checkpoint", "checkpoint"),
+                        ("commit", "commit"),
+                        ("vacuum_db", "vacuum"),
+                        ("store_log", "store logs"),
+                        ("create_file", "move files")]:
+        prof.instrument(mod, name, stage)
+
 def main():
     """
     main
@@ -338,29 +1856,88 @@ def main():
     args = parse_args(sys.argv[1:])
     if args is None:
         return 1
+    prof = None
+    if args.profile:
+        prof = parse_log.profiler()
+        instrument(prof)
+    if args.cprofile:
+        cprof = cProfile.Profile()
+        status = cprof.runcall(submit_logs, args)
+        cprof.dump_stats(args.cprofile)
+    else:
+        status = submit_logs(args)
+    if prof is not None:
+        prof.report(sys.stderr)
+    return status
+
+def submit_logs(args):
+    """
+    delete and insert records as specified by args
+    """
     logs = args.files[:]
     if args.dryrun:
-        parse_logs(logs, None)
+        parse_logs(logs, args.jobs)
         Es("submit.py: dry run. do nothing\n")
         return 0
     data_dir = args.data
-    q_dir, c_dir, d_dir = ensure_data_dir(data_dir)
-    # parse and queue the contents
-    q_logs = parse_logs(logs, q_dir)
+    q_dir, s_dir, d_dir = ensure_data_dir(data_dir)
+    if args.enqueue:
+        for log in logs:
+            Es("{} queued as {}\n"
+               .format(log, queue_log(log, q_dir, args.pretend, args.relink)))
+        logs = []
+        if (len(args.delete_seqids) == 0 and not args.delete_mine
+                and args.compact_before is None and args.compact_keep is None
+                and args.vacuum is None):
+            return 0
     a_sqlite = "{}/a.sqlite".format(data_dir)
     con, schema = open_for_transaction(a_sqlite)
+    committed = []
+    if args.migrate:
+        # open_for_transaction has brought it up to date
+        committed = backfill_log_hashes(con, schema, "{}/commit".format(data_dir))
+        do_sql(con, "analyze", 1)
+    partitioned = None
+    if args.partition:
+        partitioned = partition_db(con, schema)
+    reingested = []
+    if args.reingest != []:
+        reingested = reingest(con, schema, s_dir, args.reingest)
     deleted = delete_from_db(con, schema,
                              args.delete_seqids, args.delete_mine, args.pretend)
-    inserted = insert_into_db(con, schema, args.pretend, q_logs)
-    con.commit()
+    compacted = runs_to_compact(con, schema, args.compact_before, args.compact_keep)
+    compacted_rows = compact_runs(con, schema, compacted)
+    # parse, queue and insert the contents
+    inserted, duplicates = insert_into_db(con, schema, args.pretend, logs, q_dir,
+                                          args.follow, args.checkpoint, args.relink,
+                                          args.jobs)
+    commit(con)
+    if args.vacuum is not None:
+        steps = vacuum_db(con, args.vacuum)
+        Es("database {} vacuumed in {} steps (longest {:.3f} sec)\n"
+           .format(a_sqlite, len(steps), max([0.0] + steps)))
     con.close()
-    for (_, q_log), seqid in zip(q_logs, inserted):
-        move_to_dir(q_log, seqid, c_dir)
+    for q_log in committed + [q_log for _, q_log in inserted]:
+        store_log(q_log, s_dir)
+    if args.migrate:
+        Es("database {} migrated ({} logs moved to the store)\n"
+           .format(a_sqlite, len(committed)))
+    if partitioned is not None:
+        Es("database {} partitioned ({} runs moved to run files)\n"
+           .format(a_sqlite, partitioned))
+    if len(reingested) > 0:
+        Es("database {} reingested {} runs\n".format(a_sqlite, len(reingested)))
+    if len(compacted) > 0:
+        Es("database {} compacted {} runs ({})\n"
+           .format(a_sqlite, len(compacted),
+                   ", ".join("{} {} rows".format(n, tbl) for tbl, n in compacted_rows.items())))
     for seqid in deleted:
         create_file(seqid, d_dir)
-    if len(deleted) + len(inserted) > 0:
-        Es("database {} updated ({} deleted, {} inserted)\n"
-           .format(a_sqlite, len(deleted), len(inserted)))
+    if len(deleted) + len(inserted) + len(duplicates) > 0:
+        Es("database {} updated ({} deleted, {} inserted, {} duplicates {})\n"
+           .format(a_sqlite, len(deleted), len(inserted), len(duplicates),
+                   "relinked" if args.relink else "skipped"))
     return 0
 
-main()
+if __name__ == "__main__":
+    main()